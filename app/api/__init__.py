@@ -3,7 +3,9 @@ from fastapi import APIRouter
 from .endpoints import (
     users,
     folders,
-    files
+    files,
+    uploads,
+    metrics
 )
 
 
@@ -11,3 +13,5 @@ router = APIRouter()
 router.include_router(users.router, tags=["users"])
 router.include_router(folders.router, tags=["folders"])
 router.include_router(files.router, tags=["files"])
+router.include_router(uploads.router, tags=["uploads"])
+router.include_router(metrics.router, tags=["metrics"])
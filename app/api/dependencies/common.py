@@ -3,22 +3,37 @@ from typing import (
     Callable
 )
 
-from fastapi import Depends
-from sqlalchemy.orm import Session, sessionmaker
+from fastapi import Depends, Request, Response
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.services import BaseService
-from app.models import engine
+from app.config import settings
+from app.services import BaseService, UnitOfWork
+from app.models import session as async_session
 
 
-sync_session = sessionmaker(engine, expire_on_commit=False)
+async def get_db_session(request: Request, response: Response):
+    async with async_session() as session:
+        # Client which has just written reads from primary (read your writes)
+        session.info["use_primary"] = settings.DB_PRIMARY_COOKIE_KEY in request.cookies
 
+        @event.listens_for(session.sync_session, "after_commit")
+        def set_primary_cookie(_):
+            response.set_cookie(
+                key=settings.DB_PRIMARY_COOKIE_KEY,
+                value="1",
+                max_age=settings.DB_PRIMARY_COOKIE_EXPIRES,
+                httponly=True
+            )
 
-def get_db_session():
-    with sync_session() as session:
         yield session
 
 
-def get_service(service_type: Type[BaseService]) -> Callable[[Session], BaseService]:
-    def _get_service(db_session: Session = Depends(get_db_session)) -> BaseService:
+def get_service(service_type: Type[BaseService]) -> Callable[[AsyncSession], BaseService]:
+    def _get_service(db_session: AsyncSession = Depends(get_db_session)) -> BaseService:
         return service_type(db_session)
     return _get_service
+
+
+def get_unit_of_work(db_session: AsyncSession = Depends(get_db_session)) -> UnitOfWork:
+    return UnitOfWork(db_session)
@@ -1,3 +1,9 @@
+import math
+import time
+import hashlib
+from typing import List, Optional, Tuple
+from datetime import datetime, timezone
+
 from fastapi import (
     Depends,
     HTTPException,
@@ -9,12 +15,18 @@ from fastapi.security import (
 )
 from jose import jwt, JWTError
 from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
 
 from app.config import settings
 from app.api.scopes import SCOPES
 from app.services.users import UsersService
 from app.api.dependencies.common import get_service
+from app.models import session as async_session
+from app.lib.cache import AsyncTTLCache
+from app.lib.revocations import RevocationList
+from app.lib.ratelimit import rate_limiter
 from app.schemas.users import (
+    UserClaimsSchema,
     UserSchema,
     TokenSchema
 )
@@ -24,12 +36,108 @@ oauth2_scheme = OAuth2PasswordBearer(
     scopes=SCOPES
 )
 
+# Resolved users by username, user is loaded from database once per ttl
+users_cache = AsyncTTLCache(settings.SECURITY_USER_CACHE_SIZE, settings.SECURITY_USER_CACHE_TTL)
+
+
+def invalidate_user(username: str) -> None:
+    # Call when user is created or changed
+    users_cache.invalidate(username)
+
+
+# Verified tokens by digest, signature is checked once per token
+tokens_cache = AsyncTTLCache(settings.SECURITY_TOKEN_CACHE_SIZE, settings.SECURITY_ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+
+def decode_token(token: str) -> Tuple[dict, TokenSchema]:
+    # Raises JWTError or ValidationError, valid token is cached until it expires
+    key = hashlib.sha256(token.encode()).digest()
+    decoded = tokens_cache.get(key)
+    if decoded is not None:
+        tokens_cache.hits += 1
+        return decoded
+    tokens_cache.misses += 1
+    payload = jwt.decode(token, settings.SECURITY_SECRET_KEY, algorithms=[settings.SECURITY_ALGORITHM])
+    decoded = payload, TokenSchema(scopes=payload.get("scopes", []), username=payload.get("sub"))
+    ttl = payload.get("exp", 0) - time.time()
+    if ttl > 0:
+        tokens_cache.set(key, decoded, ttl)
+    return decoded
+
+
+# Logged out sessions and deleted users (stateless mode), tokens live no longer than refresh token
+revocations = RevocationList(settings.SECURITY_REFRESH_TOKEN_EXPIRE_MINUTES * 60)
+
+
+def to_timestamp(value: datetime) -> float:
+    # Revocation times are stored in utc
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def revoke_user_tokens(user_id: int, revoked_at: datetime) -> None:
+    # Call after revocation is committed, other workers load it on refresh
+    revocations.revoke(user_id, to_timestamp(revoked_at))
+
+
+def revoke_session_tokens(session_id: str, expires_at: datetime) -> None:
+    # Call after revocation is committed, other workers load it on refresh
+    revocations.revoke_session(session_id, to_timestamp(expires_at))
+
 
-def get_current_user(
+def is_token_revoked(user_id: int, payload: dict) -> bool:
+    # Tokens without issue time are revoked by any revocation of user
+    return revocations.is_revoked(user_id, payload.get("iat", 0), payload.get("sid"))
+
+
+async def load_revocations(since: float) -> Tuple[List[Tuple[int, float]], List[Tuple[str, float]]]:
+    async with async_session() as db_session:
+        users = UsersService(db_session)
+        items = await users.get_revocations(datetime.fromtimestamp(since, timezone.utc).replace(tzinfo=None))
+        sessions = await users.get_revoked_sessions(datetime.utcnow())
+    return (
+        [(user_id, to_timestamp(revoked_at)) for user_id, revoked_at in items],
+        [(session_id, to_timestamp(expires_at)) for session_id, expires_at in sessions]
+    )
+
+
+async def start_revocations_refresh() -> None:
+    # Default mode checks users in database, revocations aren't needed
+    if settings.SECURITY_STATELESS_TOKENS:
+        revocations.start(load_revocations, settings.SECURITY_REVOCATIONS_REFRESH_INTERVAL)
+
+
+async def stop_revocations_refresh() -> None:
+    await revocations.stop()
+
+
+async def check_request_rate(user_id: int) -> None:
+    # Token bucket of user, shared by workers
+    retry_after = await run_in_threadpool(
+        rate_limiter.take,
+        f"user:{user_id}",
+        settings.RATELIMIT_REQUESTS_PER_SECOND,
+        settings.RATELIMIT_REQUESTS_BURST
+    )
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+
+async def load_user(user: UsersService, username: str) -> Optional[UserSchema]:
+    user_data = await user.get_by_username(username)
+    if user_data is None:
+        return None
+    return UserSchema.from_orm(user_data)
+
+
+async def get_current_user(
         security_scopes: SecurityScopes,
         token: str = Depends(oauth2_scheme),
         user: UsersService = Depends(get_service(UsersService))
-) -> UserSchema:
+) -> UserClaimsSchema:
     if security_scopes.scopes:
         authenticate_value = f'Bearer scope="{security_scopes.scope_str}"'
     else:
@@ -40,21 +148,23 @@ def get_current_user(
         headers={"WWW-Authenticate": authenticate_value}
     )
     try:
-        payload = jwt.decode(token, settings.SECURITY_SECRET_KEY, algorithms=[settings.SECURITY_ALGORITHM])
+        payload, token = decode_token(token)
 
-        username: str = payload.get("sub")
+        username: str = token.username
 
         if username is None:
             raise credentials_exception
 
-        token = TokenSchema(scopes=payload.get("scopes", []), username=username)
-
-        user_data = user.get_by_username(token.username)
+        if settings.SECURITY_STATELESS_TOKENS:
+            # User is authorized by token claims, database isn't used
+            user_data = UserClaimsSchema(id=payload.get("uid"), username=username, scopes=token.scopes)
+            if is_token_revoked(user_data.id, payload):
+                raise credentials_exception
+        else:
+            user_data = await users_cache.get_or_load(token.username, lambda: load_user(user, token.username))
 
         if user_data is None:
             raise credentials_exception
-
-        user_data = UserSchema.from_orm(user_data)
     except (JWTError, ValidationError):
         raise credentials_exception
 
@@ -67,4 +177,6 @@ def get_current_user(
                     detail="Not enough permissions",
                     headers={"WWW-Authenticate": authenticate_value}
                 )
+    if settings.RATELIMIT_ENABLED:
+        await check_request_rate(user_data.id)
     return user_data
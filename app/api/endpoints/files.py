@@ -1,19 +1,24 @@
-from typing import Optional
+from typing import List, Optional
 
-from fastapi.responses import FileResponse
 from fastapi import (
     APIRouter,
     Depends,
+    Request,
+    Response,
     Security,
     UploadFile,
-    File
+    File,
+    status
 )
+from starlette.concurrency import run_in_threadpool
 
-from app.api.dependencies.common import get_service
+from app.api.dependencies.common import get_service, get_unit_of_work
 from app.api.dependencies.security import get_current_user
-from app.schemas.users import UserSchema
+from app.schemas.users import UserClaimsSchema
 from app.services.files import FilesService
 from app.services.folders import FoldersService
+from app.services.blobs import BlobsService
+from app.services import UnitOfWork
 from app.config import settings
 from app.schemas.files import (
     FileSettingsSchema,
@@ -22,11 +27,21 @@ from app.schemas.files import (
     FileBrowseSchema
 )
 from app.lib.files import (
-    save_file,
+    stage_file,
+    store_file,
     rename_file,
     delete_storage_file,
+    delete_storage_files,
     get_path_to_file,
-    move_file_to_another_folder
+    move_file_to_another_folder,
+    get_file_name
+)
+from app.lib.blobs import delete_blobs, discard_blob
+from app.lib.pagination import encode_cursor, decode_cursor
+from app.lib.responses import (
+    file_response,
+    get_file_validators,
+    is_not_modified
 )
 
 
@@ -39,53 +54,132 @@ router = APIRouter()
     name="files:upload",
     description="Upload file endpoint. Upload single file to user folder."
 )
-def upload_file(
+async def upload_file(
         folder_id: int,
         file: UploadFile = File(...),
         file_service: FilesService = Depends(get_service(FilesService)),
         folder_service: FoldersService = Depends(get_service(FoldersService)),
-        user: UserSchema = Security(get_current_user, scopes=["*"])
+        blob_service: BlobsService = Depends(get_service(BlobsService)),
+        uow: UnitOfWork = Depends(get_unit_of_work),
+        user: UserClaimsSchema = Security(get_current_user, scopes=["*"])
 ):
     # Check folder
-    folder = folder_service.get_folder_by_id(folder_id, user.id)
+    folder = await folder_service.get_folder_by_id(folder_id, user.id)
     if not folder:
         return {"message": f"Failed to upload file, folder with this id <{folder_id}> doesn't exist.'"}
     # Get correct filename
-    correct_filename = ".".join(file.filename.split(".")[:-1])
-    # Check file
-    check_file = file_service.check_file(correct_filename, folder_id, user.id)
-    if check_file:
-        return {"message": f"Failure to upload file, file with this name <{correct_filename}> already exists."}
-    # Save file in folder and database
-    result = save_file(user.id, folder.name, file.filename, file.file)
+    correct_filename = get_file_name(file.filename)
+    # Write file to temporary storage
+    result = await run_in_threadpool(stage_file, file.file)
     if isinstance(result, dict):
         return result
-    else:
-        file_service.create_file(
-            correct_filename,
-            file.filename,
-            result,
-            file.content_type,
-            folder_id,
-            user.id
-        )
+    tmp_path, digest, size = result
+    # Save file in database, nothing is saved if file with same name exists
+    file_id = await file_service.create_file(
+        correct_filename,
+        file.filename,
+        size,
+        file.content_type,
+        folder_id,
+        user.id,
+        digest
+    )
+    if not file_id:
+        await run_in_threadpool(discard_blob, tmp_path)
+        return {"message": f"Failure to upload file, file with this name <{correct_filename}> already exists."}
+    await blob_service.add_references([(digest, size)])
+    # Save file in folder
+    await run_in_threadpool(store_file, tmp_path, digest, user.id, folder.name, file.filename)
+    await uow.commit()
     return {"message": f"Successfully uploaded file."}
 
 
+# Upload many files
+@router.post(
+    "/file/upload/{folder_id}/batch",
+    name="files:upload-batch",
+    description="Upload many files to user folder at once."
+)
+async def upload_files(
+        folder_id: int,
+        files: List[UploadFile] = File(...),
+        file_service: FilesService = Depends(get_service(FilesService)),
+        folder_service: FoldersService = Depends(get_service(FoldersService)),
+        blob_service: BlobsService = Depends(get_service(BlobsService)),
+        uow: UnitOfWork = Depends(get_unit_of_work),
+        user: UserClaimsSchema = Security(get_current_user, scopes=["*"])
+):
+    # Check folder
+    folder = await folder_service.get_folder_by_id(folder_id, user.id)
+    if not folder:
+        return {"message": f"Failed to upload files, folder with this id <{folder_id}> doesn't exist.'"}
+    rows = []
+    staged = []
+    bad_files = []
+    names = set()
+    for file in files:
+        correct_filename = get_file_name(file.filename)
+        # Only first file with same name is uploaded
+        if correct_filename in names:
+            bad_files.append(file.filename)
+            file.file.close()
+            continue
+        # Write file to temporary storage
+        result = await run_in_threadpool(stage_file, file.file)
+        if isinstance(result, dict):
+            bad_files.append(file.filename)
+            continue
+        tmp_path, digest, size = result
+        names.add(correct_filename)
+        staged.append(tmp_path)
+        rows.append(
+            {
+                "name": correct_filename,
+                "full_name": file.filename,
+                "size": size,
+                "type": file.content_type,
+                "digest": digest,
+                "folder_id": folder_id,
+                "user_id": user.id
+            }
+        )
+    # Save all files in database at once, files with existing names are skipped
+    created = await file_service.create_files(rows)
+    uploaded = []
+    for elem, tmp_path in zip(rows, staged):
+        if elem["name"] in created:
+            uploaded.append(elem)
+        else:
+            bad_files.append(elem["full_name"])
+            await run_in_threadpool(discard_blob, tmp_path)
+    if uploaded:
+        await blob_service.add_references([(elem["digest"], elem["size"]) for elem in uploaded])
+        # Save files in folder
+        for elem, tmp_path in zip(rows, staged):
+            if elem["name"] in created:
+                await run_in_threadpool(store_file, tmp_path, elem["digest"], user.id, folder.name, elem["full_name"])
+        await uow.commit()
+    return {
+        "uploaded": "; ".join(elem["full_name"] for elem in uploaded),
+        "failed": "; ".join(bad_files)
+    }
+
+
 # Change file name and share mode
 @router.patch(
     "/file",
     name="files:settings",
     description="Settings for file. Funcs: rename, share"
 )
-def settings_file(
+async def settings_file(
         data: FileSettingsSchema,
         file_service: FilesService = Depends(get_service(FilesService)),
         folder_service: FoldersService = Depends(get_service(FoldersService)),
-        user: UserSchema = Security(get_current_user, scopes=["*"])
+        uow: UnitOfWork = Depends(get_unit_of_work),
+        user: UserClaimsSchema = Security(get_current_user, scopes=["*"])
 ):
     # Check file
-    file = file_service.get_file_by_id(data.file_id, user.id)
+    file = await file_service.get_file_by_id(data.file_id, user.id)
     if not file:
         return {"message": "File doesn't exist'"}
     # Check mode
@@ -95,7 +189,7 @@ def settings_file(
         result = []
         # Share
         if data.share is not None:
-            file_service.update_file_share(data.file_id, data.share)
+            await file_service.update_file_share(data.file_id, data.share)
             if data.share:
                 result.append(
                     {"share": "On", "link": f"http://{settings.PROJECT_IP}:{settings.PROJECT_PORT}/file/{data.file_id}"}
@@ -107,22 +201,23 @@ def settings_file(
         # Rename
         if data.rename is not None:
             # Check if new name is correct
-            check_file = file_service.check_file(data.rename, file.folder_id, user.id)
+            check_file = await file_service.check_file(data.rename, file.folder_id, user.id)
             if check_file:
                 result.append(
                     {"rename": f"Fail! File with this name <{data.rename}> already exists"}
                 )
             else:
                 # Get folder
-                folder = folder_service.get_folder_by_id(file.folder_id, user.id)
+                folder = await folder_service.get_folder_by_id(file.folder_id, user.id)
                 # Change file name
                 new_full_name = f"{data.rename}.{file.full_name.split('.')[-1:][0]}"
-                rename_file(file.full_name, new_full_name, folder.name, user.id)
+                await run_in_threadpool(rename_file, file.full_name, new_full_name, folder.name, user.id)
                 # Change name in db
-                file_service.update_file_name(file.id, data.rename, new_full_name)
+                await file_service.update_file_name(file.id, data.rename, new_full_name)
                 result.append(
                     {"rename": f"Successfully renamed file"}
                 )
+        await uow.commit()
         return {"result": result}
 
 
@@ -132,83 +227,142 @@ def settings_file(
     name="files:delete",
     description="Delete file endpoint. Single and multiple mode"
 )
-def delete_file(
+async def delete_file(
         data: FileDeleteSchema,
         file_service: FilesService = Depends(get_service(FilesService)),
         folder_service: FoldersService = Depends(get_service(FoldersService)),
-        user: UserSchema = Security(get_current_user, scopes=["*"])
+        blob_service: BlobsService = Depends(get_service(BlobsService)),
+        uow: UnitOfWork = Depends(get_unit_of_work),
+        user: UserClaimsSchema = Security(get_current_user, scopes=["*"])
 ):
     # Check mode
     if isinstance(data.file_id, list):
-        good_ids = set()
-        bad_ids = set()
-        # Filter ids
-        for elem in data.file_id:
-            # Check file
-            file = file_service.get_file_by_id(elem, user.id)
-            if file:
-                good_ids.add(elem)
-            else:
-                bad_ids.add(elem)
-        # Delete files
-        for elem in good_ids:
-            file = file_service.get_file_by_id(elem, user.id)
-            folder = folder_service.get_folder_by_id(file.folder_id, user.id)
-            # Delete storage file
-            delete_storage_file(user.id, folder.name, file.full_name)
-            # Delete from database
-            file_service.delete_file(file.id)
+        # Delete files from database at once
+        deleted = await file_service.delete_files(list(set(data.file_id)), user.id)
+        good_ids = {elem.id for elem in deleted}
+        bad_ids = set(data.file_id) - good_ids
+        released = await blob_service.release_references([elem.digest for elem in deleted])
+        await uow.commit()
+        # Delete storage files
+        await run_in_threadpool(
+            delete_storage_files,
+            user.id,
+            [(elem.folder_name, elem.full_name) for elem in deleted]
+        )
+        # Delete unreferenced blobs
+        await run_in_threadpool(delete_blobs, released)
         return {"deleted": "; ".join(map(str, good_ids)), "failed": "; ".join(map(str, bad_ids))}
     else:
         # Check file
-        file = file_service.get_file_by_id(data.file_id, user.id)
+        file = await file_service.get_file_by_id(data.file_id, user.id)
         if not file:
             return {"message": f"Fail, file with this id <{data.file_id}> doesn't exist'"}
-        folder = folder_service.get_folder_by_id(file.folder_id, user.id)
+        folder = await folder_service.get_folder_by_id(file.folder_id, user.id)
         # Delete storage file
-        delete_storage_file(user.id, folder.name, file.full_name)
+        await run_in_threadpool(delete_storage_file, user.id, folder.name, file.full_name)
         # Delete from database
-        file_service.delete_file(file.id)
+        await file_service.delete_file(file.id)
+        released = await blob_service.release_references([file.digest])
+        await uow.commit()
+        # Delete unreferenced blob
+        await run_in_threadpool(delete_blobs, released)
         return {"message": f"Success, file with this id <{file.id}> deleted"}
 
 
+# Search files by name
+@router.get(
+    "/file/search",
+    name="files:search",
+    description="Search files by part of name, results are ranked by similarity. "
+                "Fuzzy mode also finds names with typos"
+)
+async def search_files(
+        q: str,
+        fuzzy: bool = False,
+        limit: Optional[int] = None,
+        file_service: FilesService = Depends(get_service(FilesService)),
+        user: UserClaimsSchema = Security(get_current_user, scopes=["*"])
+):
+    if not q.strip():
+        return {"message": "Empty search query"}
+    limit = settings.FILES_SEARCH_LIMIT if limit is None else limit
+    if not 0 < limit <= settings.FILES_SEARCH_LIMIT:
+        return {"message": f"Limit must be from 1 to {settings.FILES_SEARCH_LIMIT}"}
+    files = await file_service.search_files(user.id, q.strip(), fuzzy, limit)
+    return {
+        "files": [
+            {
+                "id": elem.Files.id,
+                "name": elem.Files.name,
+                "full_name": elem.Files.full_name,
+                "type": elem.Files.type,
+                "size": elem.Files.size,
+                "folder_id": elem.Files.folder_id,
+                "folder_name": elem.folder_name,
+                "score": elem.score
+            }
+            for elem in files
+        ]
+    }
+
+
 # Download shared file
 @router.get(
     "/file/{file_id}",
     name="files:download-shared",
     description="Can download file, where shared is True"
 )
-def download_shared(
+async def download_shared(
         file_id: int,
+        request: Request,
         file_service: FilesService = Depends(get_service(FilesService)),
-        folder_service: FoldersService = Depends(get_service(FoldersService))
+        folder_service: FoldersService = Depends(get_service(FoldersService)),
+        uow: UnitOfWork = Depends(get_unit_of_work)
 ):
     # Check file
-    file = file_service.get_shared_file(file_id)
+    file = await file_service.get_shared_file(file_id)
     if not file:
         return {"message": "File not found."}
-    folder = folder_service.get_folder_from_file(file.folder_id)
+    # Check client cache
+    etag, last_modified = get_file_validators(file)
+    headers = {"etag": etag, "last-modified": last_modified, "cache-control": settings.FILES_SHARED_CACHE_CONTROL}
+    if is_not_modified(request.headers, etag, last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    folder = await folder_service.get_folder_from_file(file.folder_id)
     full_path = get_path_to_file(folder.name, file.full_name, file.user_id)
-    return FileResponse(full_path, media_type=file.type, filename=file.full_name)
+    response = file_response(full_path, media_type=file.type, filename=file.full_name, headers=headers)
+    # Session is closed after body is sent, end transaction so connection isn't held during transfer
+    await uow.rollback()
+    return response
 
 
 # Download single file
 @router.get(
     "/file/download/{file_id}"
 )
-def download_single_file(
+async def download_single_file(
         file_id: int,
+        request: Request,
         file_service: FilesService = Depends(get_service(FilesService)),
         folder_service: FoldersService = Depends(get_service(FoldersService)),
-        user: UserSchema = Security(get_current_user, scopes=["*"])
+        uow: UnitOfWork = Depends(get_unit_of_work),
+        user: UserClaimsSchema = Security(get_current_user, scopes=["*"])
 ):
     # Check file
-    file = file_service.get_file_by_id(file_id, user.id)
+    file = await file_service.get_file_by_id(file_id, user.id)
     if not file:
         return {"message": "File not found."}
-    folder = folder_service.get_folder_by_id(file.folder_id, user.id)
+    # Check client cache
+    etag, last_modified = get_file_validators(file)
+    headers = {"etag": etag, "last-modified": last_modified, "cache-control": settings.FILES_PRIVATE_CACHE_CONTROL}
+    if is_not_modified(request.headers, etag, last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    folder = await folder_service.get_folder_by_id(file.folder_id, user.id)
     full_path = get_path_to_file(folder.name, file.full_name, user.id)
-    return FileResponse(full_path, media_type=file.type, filename=file.full_name)
+    response = file_response(full_path, media_type=file.type, filename=file.full_name, headers=headers)
+    # Session is closed after body is sent, end transaction so connection isn't held during transfer
+    await uow.rollback()
+    return response
 
 
 # Move file to another folder
@@ -217,30 +371,32 @@ def download_single_file(
     name="files:move",
     description="Move file to another folder"
 )
-def move_file(
+async def move_file(
         data: FileMoveSchema,
         file_service: FilesService = Depends(get_service(FilesService)),
         folder_service: FoldersService = Depends(get_service(FoldersService)),
-        user: UserSchema = Security(get_current_user, scopes=["*"])
+        uow: UnitOfWork = Depends(get_unit_of_work),
+        user: UserClaimsSchema = Security(get_current_user, scopes=["*"])
 ):
     # Check file
-    file = file_service.get_file_by_id(data.file_id, user.id)
+    file = await file_service.get_file_by_id(data.file_id, user.id)
     if not file:
         return {"message": "File not found!"}
     # Check folder
-    folder = folder_service.get_folder_by_id(data.folder_id, user.id)
+    folder = await folder_service.get_folder_by_id(data.folder_id, user.id)
     if not folder:
         return {"message": "Folder not found!"}
     elif file.folder_id == folder.id:
         return {"message": "Same folder!"}
     # Check for same name in new folder
-    check_file = file_service.check_file(file.name, folder.id, user.id)
+    check_file = await file_service.check_file(file.name, folder.id, user.id)
     if check_file:
         return {"message": "File with same name already exists in this folder!"}
     # Move file
-    old_folder = folder_service.get_folder_by_id(file.folder_id, user.id)
-    move_file_to_another_folder(old_folder.name, folder.name, file.full_name, user.id)
-    file_service.update_folder_data(file.id, folder.id)
+    old_folder = await folder_service.get_folder_by_id(file.folder_id, user.id)
+    await run_in_threadpool(move_file_to_another_folder, old_folder.name, folder.name, file.full_name, user.id)
+    await file_service.update_folder_data(file.id, folder.id)
+    await uow.commit()
     return {"message": "Successfully move file to another folder!"}
 
 
@@ -249,47 +405,63 @@ def move_file(
     "/file",
     name="files:browse",
     description="Browse files with filters. "
-                "Can pass name_pattern and filters or only name_pattern or only filters or nothing"
+                "Can pass name_pattern and filters or only name_pattern or only filters or nothing. "
+                "Files are returned by pages, pass next_cursor as cursor to get next page"
 )
-def browse_files(
+async def browse_files(
         data: Optional[FileBrowseSchema] = None,
         file_service: FilesService = Depends(get_service(FilesService)),
-        user: UserSchema = Security(get_current_user, scopes=["*"])
+        user: UserClaimsSchema = Security(get_current_user, scopes=["*"])
 ):
+    data = data or FileBrowseSchema()
     # Check if file name pattern exist
     pattern = None
-    if data and data.name_pattern:
+    if data.name_pattern:
         pattern = f"%{data.name_pattern}%"
-    # Get files by file name pattern
-    files = file_service.browse_files(user.id, pattern)
-    if len(files) == 0:
-        return {"files": []}
+    # Check page size
+    limit = settings.FILES_BROWSE_PAGE_SIZE if data.limit is None else data.limit
+    if not 0 < limit <= settings.FILES_BROWSE_MAX_PAGE_SIZE:
+        return {"message": f"Page size must be from 1 to {settings.FILES_BROWSE_MAX_PAGE_SIZE}"}
+    # Filters
+    sort = []
+    if data.filters:
+        if data.filters.name:
+            sort.append(("name", False))
+        if data.filters.size:
+            sort.append(("size", data.filters.size == "end"))
+        if data.filters.type:
+            sort.append(("type", False))
+        if data.filters.create_date:
+            sort.append(("create_date", False))
+        elif data.filters.modified_date:
+            sort.append(("modified_date", False))
+    # Cursor stores sort keys too, it can't be used with other filters
+    sort_keys = ",".join(f"{'-' if desc else ''}{key}" for key, desc in sort)
+    after = None
+    if data.cursor:
+        after = decode_cursor(data.cursor)
+        if not after or after[0] != sort_keys or len(after) != len(sort) + 2:
+            return {"message": "Wrong cursor"}
+        after = after[1:]
+    # Get one more file to know if there is next page
+    files = await file_service.browse_files(user.id, pattern, sort, after, limit + 1)
     # Perform list with files
     all_files = []
-    for elem in files:
+    for elem in files[:limit]:
         all_files.append(
             {
-                "id": elem.id,
-                "name": elem.name,
-                "type": elem.type,
-                "size": elem.size,
-                "created_date": elem.created_at,
-                "updated_date": elem.updated_at,
-                "folder_id": elem.folder.id,
-                "folder_name": elem.folder.name
+                "id": elem.Files.id,
+                "name": elem.Files.name,
+                "type": elem.Files.type,
+                "size": elem.Files.size,
+                "created_date": elem.Files.created_at,
+                "updated_date": elem.Files.updated_at,
+                "folder_id": elem.Files.folder_id,
+                "folder_name": elem.folder_name
             }
         )
-    if not data:
-        return {"files": all_files}
-    # Filters
-    if data.filters:
-        all_files.sort(
-            key=lambda x: (
-                x["name"] if data.filters.name else None,
-                x["size"] if data.filters.size == "start" else -x["size"] if data.filters.size == "end" else None,
-                x["type"] if data.filters.type else None,
-                x["created_date"] if data.filters.create_date else None,
-                x["updated_date"] if data.filters.modified_date and not data.filters.create_date else None
-            )
-        )
-    return {"files": all_files}
+    next_cursor = None
+    if len(files) > limit:
+        last = files[limit - 1]
+        next_cursor = encode_cursor([sort_keys, *last[2:]])
+    return {"files": all_files, "next_cursor": next_cursor}
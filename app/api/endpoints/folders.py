@@ -1,17 +1,39 @@
+import calendar
+import mimetypes
+from typing import Literal
+
 from fastapi import (
     APIRouter,
     Depends,
-    Security
+    Security,
+    UploadFile,
+    File
 )
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
 from app.services.folders import FoldersService
-from app.api.dependencies.common import get_service
+from app.services.files import FilesService
+from app.services.blobs import BlobsService
+from app.services import UnitOfWork
+from app.api.dependencies.common import get_service, get_unit_of_work
 from app.api.dependencies.security import get_current_user
-from app.schemas.users import UserSchema
+from app.schemas.users import UserClaimsSchema
 from app.lib.folders import (
     create_dir,
+    create_dirs,
     rename_dir,
-    delete_dir
+    delete_dir,
+    delete_dirs
+)
+from app.lib.blobs import delete_blobs, discard_blob
+from app.lib.files import get_path_to_file, get_file_name, store_file
+from app.lib.responses import get_content_disposition
+from app.lib.archives import (
+    iter_zip,
+    iter_tar,
+    list_archive,
+    extract_archive
 )
 from app.schemas.folder import (
     FoldersListSchema,
@@ -28,11 +50,11 @@ router = APIRouter()
     response_model=FoldersListSchema,
     name="folders:list"
 )
-def get_folders(
+async def get_folders(
         folder: FoldersService = Depends(get_service(FoldersService)),
-        user: UserSchema = Security(get_current_user, scopes=["*"])
+        user: UserClaimsSchema = Security(get_current_user, scopes=["*"])
 ):
-    folders = folder.get_folders_by_user_id(user.id)
+    folders = await folder.get_folders_by_user_id(user.id)
     data = []
     for elem in folders:
         data.append({"folder_id": elem.id, "folder_name": elem.name})
@@ -44,38 +66,31 @@ def get_folders(
     name="folders:create",
     description="Create folder endpoint. Has two mods (single and multiple)"
 )
-def create_folder(
+async def create_folder(
         folder_data: FolderCreateSchema,
         folder: FoldersService = Depends(get_service(FoldersService)),
-        user: UserSchema = Security(get_current_user, scopes=["*"])
+        uow: UnitOfWork = Depends(get_unit_of_work),
+        user: UserClaimsSchema = Security(get_current_user, scopes=["*"])
 ):
     # Check mode (single or multiple)
     if isinstance(folder_data.name, list):
-        bad_folders = set()
-        good_folders = set()
-        # Filter names
-        for elem in folder_data.name:
-            check_folder = folder.get_folder_by_name(elem, user.id)
-            if check_folder:
-                bad_folders.add(elem)
-            else:
-                good_folders.add(elem)
-        # Create folders
-        for elem in good_folders:
-            create_dir(elem, user.id)
-            folder.create_folder(elem, user.id)
+        names = set(folder_data.name)
+        # Create folders, existing names are skipped
+        good_folders = await folder.create_folders(list(names), user.id)
+        bad_folders = names - good_folders
+        if good_folders:
+            await run_in_threadpool(create_dirs, list(good_folders), user.id)
+            await uow.commit()
         return {
             "created": "; ".join(good_folders),
             "failed": "; ".join(bad_folders)
         }
     else:
-        check_folder = folder.get_folder_by_name(folder_data.name, user.id)
-        # Check name
-        if check_folder:
+        # Create folder, nothing is created if name exists
+        if not await folder.create_folder(folder_data.name, user.id):
             return {"message": "Failure creating. Folder with this name already exists."}
-        # Create folder
-        create_dir(folder_data.name, user.id)
-        folder.create_folder(folder_data.name, user.id)
+        await run_in_threadpool(create_dir, folder_data.name, user.id)
+        await uow.commit()
         return {"message": "Successfully created."}
 
 
@@ -83,20 +98,22 @@ def create_folder(
     "/folder",
     name="folders:rename"
 )
-def rename_folder(
+async def rename_folder(
         data: FolderRenameSchema,
         folder: FoldersService = Depends(get_service(FoldersService)),
-        user: UserSchema = Security(get_current_user, scopes=["*"])
+        uow: UnitOfWork = Depends(get_unit_of_work),
+        user: UserClaimsSchema = Security(get_current_user, scopes=["*"])
 ):
     # Check if folder exists
-    check_old_folder = folder.get_folder_by_name(data.old_name, user.id)
+    check_old_folder = await folder.get_folder_by_name(data.old_name, user.id)
     if not check_old_folder:
         return {"message": "Fail! Folder with this name doesn't exist'"}
-    check_new_folder = folder.get_folder_by_name(data.new_name, user.id)
+    check_new_folder = await folder.get_folder_by_name(data.new_name, user.id)
     if check_new_folder:
         return {"message": f"Fail! Folder with this name <{data.new_name}> already exists"}
-    folder.rename_folder(data.old_name, data.new_name, user.id)
-    rename_dir(data.old_name, data.new_name, user.id)
+    await folder.rename_folder(data.old_name, data.new_name, user.id)
+    await uow.commit()
+    await run_in_threadpool(rename_dir, data.old_name, data.new_name, user.id)
     return {"message": "Successfully renamed!"}
 
 
@@ -105,33 +122,153 @@ def rename_folder(
     name="folders:delete",
     description="Delete folder endpoint. Has two mods (single and multiple)"
 )
-def delete_folder(
+async def delete_folder(
         data: FolderDeleteSchema,
         folder: FoldersService = Depends(get_service(FoldersService)),
-        user: UserSchema = Security(get_current_user, scopes=["*"])
+        file_service: FilesService = Depends(get_service(FilesService)),
+        blob_service: BlobsService = Depends(get_service(BlobsService)),
+        uow: UnitOfWork = Depends(get_unit_of_work),
+        user: UserClaimsSchema = Security(get_current_user, scopes=["*"])
 ):
     if isinstance(data.name, list):
-        good_folders = set()
-        bad_folders = set()
         # Filter folders
-        for elem in data.name:
-            check_folder = folder.get_folder_by_name(elem, user.id)
-            if check_folder:
-                good_folders.add(elem)
-            else:
-                bad_folders.add(elem)
+        good_folders = {elem.name: elem.id for elem in await folder.get_folders_by_names(list(set(data.name)), user.id)}
+        bad_folders = set(data.name) - set(good_folders)
         # Delete folders
-        for elem in good_folders:
-            folder.delete_folder(elem, user.id)
-            delete_dir(elem, user.id)
+        digests = await file_service.delete_folders_files(list(good_folders.values()))
+        await folder.delete_folders(list(good_folders.values()), user.id)
+        released = await blob_service.release_references(digests)
+        await uow.commit()
+        await run_in_threadpool(delete_dirs, list(good_folders), user.id)
+        # Delete unreferenced blobs
+        await run_in_threadpool(delete_blobs, released)
         return {
             "deleted": "; ".join(good_folders),
             "failed": "; ".join(bad_folders)
         }
     else:
-        check_folder = folder.get_folder_by_name(data.name, user.id)
+        check_folder = await folder.get_folder_by_name(data.name, user.id, for_update=True)
         if not check_folder:
             return {"message": "Fail! Folder with this name doesn't exist'"}
-        folder.delete_folder(data.name, user.id)
-        delete_dir(data.name, user.id)
+        digests = await file_service.delete_folder_files(check_folder.id)
+        await folder.delete_folder(data.name, user.id)
+        released = await blob_service.release_references(digests)
+        await uow.commit()
+        await run_in_threadpool(delete_dir, data.name, user.id)
+        # Delete unreferenced blobs
+        await run_in_threadpool(delete_blobs, released)
         return {"message": "Successfully deleted the folder"}
+
+
+@router.get(
+    "/folder/{folder_id}/export",
+    name="folders:export",
+    description="Download whole folder as zip (without compression) or tar archive"
+)
+async def export_folder(
+        folder_id: int,
+        archive: Literal["zip", "tar"] = "zip",
+        folder: FoldersService = Depends(get_service(FoldersService)),
+        file_service: FilesService = Depends(get_service(FilesService)),
+        uow: UnitOfWork = Depends(get_unit_of_work),
+        user: UserClaimsSchema = Security(get_current_user, scopes=["*"])
+):
+    check_folder = await folder.get_folder_by_id(folder_id, user.id)
+    if not check_folder:
+        return {"message": "Fail! Folder with this id doesn't exist'"}
+    files = await file_service.get_files_by_folder_id(folder_id, user.id)
+    folder_name = check_folder.name
+    entries = [
+        (
+            get_path_to_file(folder_name, elem.full_name, user.id),
+            elem.full_name,
+            calendar.timegm((elem.updated_at or elem.created_at).timetuple())
+        )
+        for elem in files
+    ]
+    # Session is closed after body is sent, end transaction so connection isn't held during transfer
+    await uow.rollback()
+    # Archive is generated while it's sent
+    if archive == "zip":
+        content, media_type = iter_zip(entries), "application/zip"
+    else:
+        content, media_type = iter_tar(entries), "application/x-tar"
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"content-disposition": get_content_disposition(f"{folder_name}.{archive}")}
+    )
+
+
+@router.post(
+    "/folder/{folder_id}/import",
+    name="folders:import",
+    description="Upload zip or tar archive and extract its files into folder"
+)
+async def import_folder(
+        folder_id: int,
+        file: UploadFile = File(...),
+        folder: FoldersService = Depends(get_service(FoldersService)),
+        file_service: FilesService = Depends(get_service(FilesService)),
+        blob_service: BlobsService = Depends(get_service(BlobsService)),
+        uow: UnitOfWork = Depends(get_unit_of_work),
+        user: UserClaimsSchema = Security(get_current_user, scopes=["*"])
+):
+    check_folder = await folder.get_folder_by_id(folder_id, user.id)
+    if not check_folder:
+        return {"message": "Fail! Folder with this id doesn't exist'"}
+    names = await run_in_threadpool(list_archive, file.file)
+    if names is None:
+        return {"message": "Fail! File isn't zip or tar archive"}
+    # Filter names, files with same name (without extension) can't be in one folder
+    existing = await file_service.get_existing_names(
+        list({get_file_name(elem) for elem in names}),
+        folder_id,
+        user.id
+    )
+    good_files = set()
+    bad_files = set()
+    taken = set(existing)
+    for elem in names:
+        correct_filename = get_file_name(elem)
+        if correct_filename in taken:
+            bad_files.add(elem)
+        else:
+            taken.add(correct_filename)
+            good_files.add(elem)
+    # Extract files
+    extracted, failed = await run_in_threadpool(extract_archive, file.file, good_files)
+    bad_files.update(failed)
+    file.file.close()
+    rows = [
+        {
+            "name": get_file_name(elem),
+            "full_name": elem,
+            "size": size,
+            "type": mimetypes.guess_type(elem)[0] or "application/octet-stream",
+            "digest": digest,
+            "folder_id": folder_id,
+            "user_id": user.id
+        }
+        for elem, _, digest, size in extracted
+    ]
+    # Save all files in database at once, files created meanwhile are skipped
+    created = await file_service.create_files(rows)
+    imported = []
+    for elem, (_, tmp_path, _, _) in zip(rows, extracted):
+        if elem["name"] in created:
+            imported.append(elem)
+        else:
+            bad_files.add(elem["full_name"])
+            await run_in_threadpool(discard_blob, tmp_path)
+    if imported:
+        await blob_service.add_references([(elem["digest"], elem["size"]) for elem in imported])
+        # Save files in folder
+        for elem, (_, tmp_path, _, _) in zip(rows, extracted):
+            if elem["name"] in created:
+                await run_in_threadpool(store_file, tmp_path, elem["digest"], user.id, check_folder.name, elem["full_name"])
+        await uow.commit()
+    return {
+        "imported": "; ".join(elem["full_name"] for elem in imported),
+        "failed": "; ".join(bad_files)
+    }
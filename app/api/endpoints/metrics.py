@@ -0,0 +1,38 @@
+from fastapi import (
+    APIRouter,
+    Security
+)
+
+from app.models import engine, replica_engines
+from app.api.dependencies.security import (
+    get_current_user,
+    users_cache,
+    tokens_cache,
+    revocations
+)
+from app.lib.security import password_hasher
+from app.lib.ratelimit import rate_limiter
+from app.schemas.users import UserClaimsSchema
+
+
+router = APIRouter()
+
+
+# Live metrics of this worker
+@router.get(
+    "/metrics",
+    name="metrics:get",
+    description="Database connection pool, cache and password hasher metrics of worker process. Admin only."
+)
+async def get_metrics(
+        user: UserClaimsSchema = Security(get_current_user, scopes=["admin"])
+):
+    return {
+        "pool": engine.pool.get_metrics(),
+        "replica_pools": [replica.pool.get_metrics() for replica in replica_engines],
+        "users_cache": users_cache.get_metrics(),
+        "tokens_cache": tokens_cache.get_metrics(),
+        "password_hasher": password_hasher.get_metrics(),
+        "revocations": revocations.get_metrics(),
+        "rate_limiter": rate_limiter.get_metrics()
+    }
@@ -0,0 +1,242 @@
+from uuid import uuid4
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    Request,
+    Security
+)
+from starlette.concurrency import run_in_threadpool
+
+from app.api.dependencies.common import get_service, get_unit_of_work
+from app.api.dependencies.security import get_current_user
+from app.schemas.users import UserClaimsSchema
+from app.schemas.uploads import UploadSessionCreateSchema
+from app.services.files import FilesService
+from app.services.folders import FoldersService
+from app.services.uploads import UploadSessionsService
+from app.services.blobs import BlobsService
+from app.services import UnitOfWork
+from app.config import settings
+from app.lib.uploads import (
+    create_session_dir,
+    delete_session_dir,
+    get_session_dirs,
+    get_received_chunks,
+    save_chunk,
+    assemble_chunks
+)
+from app.lib.files import get_file_name, is_valid_file_name, store_file
+from app.lib.blobs import discard_blob
+
+
+router = APIRouter()
+
+
+def get_chunks_count(size: int, chunk_size: int):
+    return -(-size // chunk_size)
+
+
+def get_chunk_size(session, index: int):
+    return min(session.chunk_size, session.size - index * session.chunk_size)
+
+
+# Start upload session
+@router.post(
+    "/file/upload/{folder_id}/session",
+    name="uploads:create",
+    description="Start resumable upload session. File is uploaded by chunks and then completed."
+)
+async def create_upload_session(
+        folder_id: int,
+        data: UploadSessionCreateSchema,
+        upload_service: UploadSessionsService = Depends(get_service(UploadSessionsService)),
+        file_service: FilesService = Depends(get_service(FilesService)),
+        folder_service: FoldersService = Depends(get_service(FoldersService)),
+        uow: UnitOfWork = Depends(get_unit_of_work),
+        user: UserClaimsSchema = Security(get_current_user, scopes=["*"])
+):
+    # Remove abandoned sessions
+    expired_sessions = await upload_service.delete_expired_sessions()
+    await uow.commit()
+    for session_id, user_id in expired_sessions:
+        await run_in_threadpool(delete_session_dir, user_id, session_id)
+    session_dirs = await run_in_threadpool(get_session_dirs, user.id)
+    active_sessions = await upload_service.get_session_ids(user.id)
+    for session_id in session_dirs:
+        if session_id not in active_sessions:
+            await run_in_threadpool(delete_session_dir, user.id, session_id)
+    # Check folder
+    folder = await folder_service.get_folder_by_id(folder_id, user.id)
+    if not folder:
+        return {"message": f"Failed to start upload, folder with this id <{folder_id}> doesn't exist.'"}
+    # Check sizes
+    chunk_size = data.chunk_size or settings.FILES_UPLOAD_SESSION_CHUNK_SIZE
+    if data.size < 0 or not 0 < chunk_size <= settings.FILES_UPLOAD_SESSION_MAX_CHUNK_SIZE:
+        return {"message": "Failed to start upload, wrong file or chunk size."}
+    # Check file
+    if not is_valid_file_name(data.file_name):
+        return {"message": "Failed to start upload, wrong file name."}
+    correct_filename = get_file_name(data.file_name)
+    check_file = await file_service.check_file(correct_filename, folder_id, user.id)
+    if check_file:
+        return {"message": f"Failed to start upload, file with this name <{correct_filename}> already exists."}
+    # Create session
+    session_id = uuid4().hex
+    await upload_service.create_session(
+        session_id,
+        correct_filename,
+        data.file_name,
+        data.size,
+        chunk_size,
+        data.content_type,
+        settings.FILES_UPLOAD_SESSION_EXPIRE_MINUTES,
+        folder_id,
+        user.id
+    )
+    await uow.commit()
+    # Dir is created after session is committed, so cleanup of other request doesn't remove it
+    await run_in_threadpool(create_session_dir, user.id, session_id)
+    return {
+        "session_id": session_id,
+        "chunk_size": chunk_size,
+        "chunks": get_chunks_count(data.size, chunk_size)
+    }
+
+
+# Upload session status
+@router.get(
+    "/file/session/{session_id}",
+    name="uploads:status",
+    description="Get already received chunks of upload session"
+)
+async def get_upload_session(
+        session_id: str,
+        upload_service: UploadSessionsService = Depends(get_service(UploadSessionsService)),
+        user: UserClaimsSchema = Security(get_current_user, scopes=["*"])
+):
+    session = await upload_service.get_session(session_id, user.id)
+    if not session:
+        return {"message": "Upload session not found."}
+    chunks = get_chunks_count(session.size, session.chunk_size)
+    received = await run_in_threadpool(get_received_chunks, user.id, session_id)
+    return {
+        "session_id": session_id,
+        "size": session.size,
+        "chunk_size": session.chunk_size,
+        "chunks": chunks,
+        "received": [
+            {"index": index, "offset": index * session.chunk_size, "size": received[index]}
+            for index in sorted(received)
+        ],
+        "missing": [index for index in range(chunks) if index not in received],
+        "expires_at": session.expires_at
+    }
+
+
+# Upload chunk
+@router.put(
+    "/file/session/{session_id}/{index}",
+    name="uploads:chunk",
+    description="Upload single chunk as request body. Chunks can be sent in any order and in parallel."
+)
+async def upload_chunk(
+        session_id: str,
+        index: int,
+        request: Request,
+        upload_service: UploadSessionsService = Depends(get_service(UploadSessionsService)),
+        user: UserClaimsSchema = Security(get_current_user, scopes=["*"])
+):
+    session = await upload_service.get_session(session_id, user.id)
+    if not session:
+        return {"message": "Upload session not found."}
+    if not 0 <= index < get_chunks_count(session.size, session.chunk_size):
+        return {"message": f"Wrong chunk index <{index}>."}
+    chunk_size = get_chunk_size(session, index)
+    if not await save_chunk(user.id, session_id, index, chunk_size, request.stream()):
+        return {"message": f"Failed to upload chunk, expected exactly {chunk_size} bytes."}
+    return {"message": f"Successfully uploaded chunk <{index}>."}
+
+
+# Complete upload session
+@router.post(
+    "/file/session/{session_id}/complete",
+    name="uploads:complete",
+    description="Assemble uploaded chunks into file"
+)
+async def complete_upload_session(
+        session_id: str,
+        upload_service: UploadSessionsService = Depends(get_service(UploadSessionsService)),
+        file_service: FilesService = Depends(get_service(FilesService)),
+        folder_service: FoldersService = Depends(get_service(FoldersService)),
+        blob_service: BlobsService = Depends(get_service(BlobsService)),
+        uow: UnitOfWork = Depends(get_unit_of_work),
+        user: UserClaimsSchema = Security(get_current_user, scopes=["*"])
+):
+    session = await upload_service.get_session(session_id, user.id)
+    if not session:
+        return {"message": "Upload session not found."}
+    # Check chunks
+    chunks = get_chunks_count(session.size, session.chunk_size)
+    received = await run_in_threadpool(get_received_chunks, user.id, session_id)
+    missing = [index for index in range(chunks) if index not in received]
+    if missing:
+        return {"message": "Failed to complete upload, some chunks are missing.", "missing": missing}
+    # Check folder
+    folder = await folder_service.get_folder_by_id(session.folder_id, user.id)
+    if not folder:
+        return {"message": "Failed to complete upload, folder doesn't exist."}
+    name, full_name, content_type, folder_id, folder_name = (
+        session.name, session.full_name, session.type, session.folder_id, folder.name
+    )
+    # File can be assembled for minutes, connection isn't held in transaction meanwhile
+    await uow.rollback()
+    result = await run_in_threadpool(assemble_chunks, user.id, session_id, chunks)
+    if isinstance(result, dict):
+        return result
+    tmp_path, digest, size = result
+    # Close session, so it can't be completed twice, file is saved in the same short transaction
+    if not await upload_service.delete_session(session_id):
+        await run_in_threadpool(discard_blob, tmp_path)
+        return {"message": "Upload session not found."}
+    file_id = await file_service.create_file(
+        name,
+        full_name,
+        size,
+        content_type,
+        folder_id,
+        user.id,
+        digest
+    )
+    if not file_id:
+        # Session stays open if file with same name exists
+        await uow.rollback()
+        await run_in_threadpool(discard_blob, tmp_path)
+        return {"message": f"Failed to complete upload, file with this name <{name}> already exists."}
+    await blob_service.add_references([(digest, size)])
+    # Save file in folder
+    await run_in_threadpool(store_file, tmp_path, digest, user.id, folder_name, full_name)
+    await uow.commit()
+    await run_in_threadpool(delete_session_dir, user.id, session_id)
+    return {"message": f"Successfully uploaded file."}
+
+
+# Cancel upload session
+@router.delete(
+    "/file/session/{session_id}",
+    name="uploads:delete",
+    description="Cancel upload session and remove uploaded chunks"
+)
+async def delete_upload_session(
+        session_id: str,
+        upload_service: UploadSessionsService = Depends(get_service(UploadSessionsService)),
+        uow: UnitOfWork = Depends(get_unit_of_work),
+        user: UserClaimsSchema = Security(get_current_user, scopes=["*"])
+):
+    session = await upload_service.get_session(session_id, user.id)
+    if not session:
+        return {"message": "Upload session not found."}
+    await upload_service.delete_session(session_id)
+    await uow.commit()
+    await run_in_threadpool(delete_session_dir, user.id, session_id)
+    return {"message": "Upload session deleted."}
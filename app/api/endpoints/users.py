@@ -1,3 +1,5 @@
+import time
+from uuid import uuid4
 from typing import Optional
 from datetime import (
     datetime,
@@ -16,17 +18,28 @@ from fastapi import (
 )
 from fastapi.security import OAuth2PasswordRequestForm
 from jose import jwt, JWTError
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
 
 from app.config import settings
 from app.models.models import Users
+from app.services import UnitOfWork
 from app.services.users import UsersService
-from app.api.dependencies.common import get_service
-from app.api.dependencies.security import get_current_user
-from app.lib.security import verify_password, get_password_hash
+from app.api.dependencies.common import get_service, get_unit_of_work
+from app.api.dependencies.security import (
+    oauth2_scheme,
+    get_current_user,
+    decode_token,
+    invalidate_user,
+    is_token_revoked,
+    revoke_user_tokens,
+    revoke_session_tokens
+)
+from app.lib.security import password_hasher, PasswordHasherBusy
 from app.lib.folders import create_main_dir
 from app.schemas.users import (
     TokenResponseSchema,
-    UserSchema,
+    UserClaimsSchema,
     UserRegisterSchema
 )
 
@@ -37,19 +50,23 @@ router = APIRouter()
 def create_token(data: dict, expires_delta: timedelta):
     data_copy = data.copy()
     expire = datetime.utcnow() + expires_delta
-    data_copy.update({"exp": expire})
+    # Issue time with fraction, token made right after logout isn't revoked
+    data_copy.update({"exp": expire, "iat": time.time()})
     encoded = jwt.encode(data_copy, settings.SECURITY_SECRET_KEY, algorithm=settings.SECURITY_ALGORITHM)
     return encoded
 
 
-def create_user_tokens(user: Users):
+def create_user_tokens(user: Users, session_id: str):
+    # Tokens of one login share session id, logout revokes only them (stateless mode)
     access_token_expires = timedelta(minutes=settings.SECURITY_ACCESS_TOKEN_EXPIRE_MINUTES)
     refresh_token_expires = timedelta(minutes=settings.SECURITY_REFRESH_TOKEN_EXPIRE_MINUTES)
 
-    # Create access token
+    # Create access token, it has all claims endpoints need (stateless mode)
     access_token = create_token(
         data={
             "sub": user.username,
+            "uid": user.id,
+            "sid": session_id,
             "scopes": user.scopes
         },
         expires_delta=access_token_expires
@@ -57,7 +74,9 @@ def create_user_tokens(user: Users):
     # Create refresh token
     refresh_token = create_token(
         data={
-            "sub": user.username
+            "sub": user.username,
+            "uid": user.id,
+            "sid": session_id
         },
         expires_delta=refresh_token_expires
     )
@@ -65,6 +84,18 @@ def create_user_tokens(user: Users):
     return access_token, refresh_token
 
 
+async def run_password_task(task, *args):
+    # Password hashing is saturated, client should retry later
+    try:
+        return await task(*args)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, try again later",
+            headers={"Retry-After": str(settings.SECURITY_PASSWORD_RETRY_AFTER)}
+        )
+
+
 def set_refresh_token_cookie(response: Response, token: str):
     response.set_cookie(
         key=settings.SECURITY_REFRESH_TOKEN_COOKIE_KEY,
@@ -83,28 +114,29 @@ def set_refresh_token_cookie(response: Response, token: str):
     "/register",
     name="users:register"
 )
-def register_user(
+async def register_user(
         user_data: UserRegisterSchema,
         user: UsersService = Depends(get_service(UsersService)),
+        uow: UnitOfWork = Depends(get_unit_of_work)
 ):
-    # Check if user with same username exist
-    if user.get_by_username(user_data.username):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="User with same username exist"
-        )
     # Hash password
-    hashed_password = get_password_hash(user_data.password)
-    # Create new user
-    user.create_user(
+    hashed_password = await run_password_task(password_hasher.hash, user_data.password)
+    # Create new user, nothing is created if user with same username exist
+    user_id = await user.create_user(
         user_data.username,
         hashed_password,
         user_data.full_name,
         age=user_data.age
     )
+    if user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="User with same username exist"
+        )
+    await uow.commit()
+    invalidate_user(user_data.username)
     # Create main root
-    user_id = user.get_by_username(user_data.username).id
-    create_main_dir(user_id)
+    await run_in_threadpool(create_main_dir, user_id)
     return {"message": "User successfully created"}
 
 
@@ -114,17 +146,30 @@ def register_user(
     response_model=TokenResponseSchema,
     name="users:login"
 )
-def login_users(
+async def login_users(
         request: Request,
         response: Response,
         form_data: OAuth2PasswordRequestForm = Depends(),
-        user: UsersService = Depends(get_service(UsersService))
+        user: UsersService = Depends(get_service(UsersService)),
+        uow: UnitOfWork = Depends(get_unit_of_work)
 ):
     # Check if user data is correct
-    user_data = user.get_by_username(form_data.username)
-    if not (user_data and verify_password(form_data.password, user_data.password)):
+    user_data = await user.get_by_username(form_data.username)
+    if user_data is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad data!")
+    verified, new_hash = await run_password_task(
+        password_hasher.verify_and_update,
+        form_data.password,
+        user_data.password
+    )
+    if not verified:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bad data!")
-    access_token, refresh_token = create_user_tokens(user_data)
+    # Rounds were changed, store hash with current cost
+    if new_hash is not None:
+        await user.update_password(user_data.id, new_hash)
+        await uow.commit()
+        invalidate_user(user_data.username)
+    access_token, refresh_token = create_user_tokens(user_data, uuid4().hex)
     # Set cookie
     set_refresh_token_cookie(response, refresh_token)
     return {
@@ -139,7 +184,7 @@ def login_users(
     response_model=TokenResponseSchema,
     name="users:refresh-token"
 )
-def refresh_token(
+async def refresh_token(
         request: Request,
         response: Response,
         token: Optional[str] = Cookie(None, alias=settings.SECURITY_REFRESH_TOKEN_COOKIE_KEY),
@@ -153,21 +198,24 @@ def refresh_token(
         raise credentials_exception
     # Try to get username from refresh token
     try:
-        payload = jwt.decode(token, settings.SECURITY_SECRET_KEY, algorithms=[settings.SECURITY_ALGORITHM])
+        payload, token_data = decode_token(token)
 
-        username: str = payload.get("sub")
+        username: str = token_data.username
 
         if username is None:
             raise credentials_exception
-    except JWTError:
+    except (JWTError, ValidationError):
         raise credentials_exception
     # Get user
-    user_data = user.get_by_username(username)
+    user_data = await user.get_by_username(username)
 
     if user_data is None:
         raise credentials_exception
 
-    access_token, refresh_token = create_user_tokens(user_data)
+    if settings.SECURITY_STATELESS_TOKENS and is_token_revoked(user_data.id, payload):
+        raise credentials_exception
+
+    access_token, refresh_token = create_user_tokens(user_data, payload.get("sid") or uuid4().hex)
 
     set_refresh_token_cookie(response, refresh_token)
 
@@ -182,10 +230,28 @@ def refresh_token(
     "/logout",
     name="users:logout"
 )
-def logout(
+async def logout(
         response: Response,
-        user: UserSchema = Security(get_current_user)
+        token: str = Depends(oauth2_scheme),
+        user: UserClaimsSchema = Security(get_current_user),
+        users: UsersService = Depends(get_service(UsersService)),
+        uow: UnitOfWork = Depends(get_unit_of_work)
 ):
+    # Stateless tokens of this session are revoked, default mode only removes refresh cookie
+    if settings.SECURITY_STATELESS_TOKENS:
+        payload, _ = decode_token(token)
+        session_id = payload.get("sid")
+        if session_id:
+            expires_at = datetime.utcnow() + timedelta(minutes=settings.SECURITY_REFRESH_TOKEN_EXPIRE_MINUTES)
+            await users.revoke_session(session_id, expires_at)
+            await uow.commit()
+            revoke_session_tokens(session_id, expires_at)
+        else:
+            # Token without session, all tokens of user issued before now are revoked
+            revoked_at = datetime.utcnow()
+            await users.revoke_tokens(user.id, revoked_at)
+            await uow.commit()
+            revoke_user_tokens(user.id, revoked_at)
     response.delete_cookie(
         settings.SECURITY_REFRESH_TOKEN_COOKIE_KEY,
         settings.SECURITY_REFRESH_TOKEN_COOKIE_PATH,
@@ -0,0 +1,77 @@
+from typing import Optional
+
+import anyio
+from jose import JWTError
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import settings
+from app.api.dependencies.security import decode_token
+from app.lib.ratelimit import rate_limiter
+
+
+def get_body_size(headers: Headers) -> Optional[int]:
+    # Body of unknown size takes whole limit
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        return settings.RATELIMIT_UPLOAD_BYTES
+    try:
+        return int(headers.get("content-length", 0))
+    except ValueError:
+        return None
+
+
+def get_token_user_id(headers: Headers) -> Optional[int]:
+    # Invalid token is rejected by endpoint
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        payload, _ = decode_token(token)
+    except (JWTError, ValidationError):
+        return None
+    return payload.get("uid")
+
+
+# Limits upload bytes in flight per user. Body is read before dependencies are solved,
+# so uploads are admitted here, before body is received.
+class UploadAdmissionMiddleware:
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.RATELIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        size = get_body_size(headers)
+        user_id = None
+        if size is not None and size >= settings.RATELIMIT_UPLOAD_MIN_BYTES:
+            user_id = get_token_user_id(headers)
+        if user_id is None:
+            await self.app(scope, receive, send)
+            return
+        lease_id = await run_in_threadpool(
+            rate_limiter.acquire,
+            f"user:{user_id}",
+            size,
+            settings.RATELIMIT_UPLOAD_BYTES,
+            settings.RATELIMIT_UPLOAD_LEASE_SECONDS
+        )
+        if lease_id is None:
+            response = JSONResponse(
+                {"detail": "Too many uploads in progress"},
+                status_code=429,
+                headers={"Retry-After": str(settings.RATELIMIT_UPLOAD_RETRY_AFTER)}
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # Sqlite can wait for lock, so it's run in thread, shielded to release lease of cancelled request too
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(rate_limiter.release, lease_id)
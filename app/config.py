@@ -1,5 +1,5 @@
 from functools import lru_cache
-from typing import List, Literal, Union
+from typing import List, Literal, Optional, Union
 from ipaddress import IPv4Address
 
 from pydantic import BaseSettings, Field
@@ -27,6 +27,43 @@ class Settings(BaseSettings):
     SECURITY_REFRESH_TOKEN_COOKIE_HTTPONLY: bool = True
     SECURITY_REFRESH_TOKEN_COOKIE_SECURE: bool = True
     SECURITY_REFRESH_TOKEN_COOKIE_SAMESITE: Literal["lax", "strict", "none"] = "none"
+    SECURITY_USER_CACHE_SIZE: int = 10000  # users per worker
+    SECURITY_USER_CACHE_TTL: int = 60  # seconds
+    SECURITY_TOKEN_CACHE_SIZE: int = 10000  # verified tokens per worker, kept until expiration
+    # Authorize by user id and scopes of access token, without user lookup
+    SECURITY_STATELESS_TOKENS: bool = False
+    SECURITY_REVOCATIONS_REFRESH_INTERVAL: int = 30  # seconds, logouts of other workers are seen after it
+    SECURITY_BCRYPT_ROUNDS: int = 12  # hashes with other cost are updated on login
+    SECURITY_PASSWORD_WORKERS: int = 2  # processes for password hashing per worker
+    SECURITY_PASSWORD_QUEUE_SIZE: int = 16  # waiting hash tasks, 503 above it
+    SECURITY_PASSWORD_RETRY_AFTER: int = 1  # seconds
+
+    # Files
+    FILES_UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # bytes (1 MiB)
+    FILES_UPLOAD_SESSION_CHUNK_SIZE: int = 8 * 1024 * 1024  # bytes (8 MiB)
+    FILES_UPLOAD_SESSION_MAX_CHUNK_SIZE: int = 64 * 1024 * 1024  # bytes (64 MiB)
+    FILES_UPLOAD_SESSION_EXPIRE_MINUTES: int = 1440  # 1 day
+    FILES_SHARED_CACHE_CONTROL: str = "public, max-age=300"
+    FILES_PRIVATE_CACHE_CONTROL: str = "private, no-cache"
+    FILES_DOWNLOAD_CHUNK_SIZE: int = 1024 * 1024  # bytes (1 MiB)
+    FILES_BROWSE_PAGE_SIZE: int = 100
+    FILES_BROWSE_MAX_PAGE_SIZE: int = 1000
+    FILES_SEARCH_LIMIT: int = 50
+    FILES_SEARCH_SIMILARITY_THRESHOLD: float = 0.3  # typo-tolerant search, 0..1
+    FILES_STORAGE_WORKERS: int = 8  # threads for parallel storage operations per worker
+    # Let front server send files: "x-accel-redirect" (nginx) or "x-sendfile" (apache, lighttpd)
+    FILES_DOWNLOAD_OFFLOAD: Optional[Literal["x-accel-redirect", "x-sendfile"]] = None
+    FILES_DOWNLOAD_OFFLOAD_PREFIX: str = "/protected/"  # nginx internal location for app/folders
+
+    # Rate limits, per user and shared by workers of host through sqlite file
+    RATELIMIT_ENABLED: bool = True
+    RATELIMIT_DB_PATH: str = "/tmp/test_task_ratelimit.db"
+    RATELIMIT_REQUESTS_PER_SECOND: float = 20
+    RATELIMIT_REQUESTS_BURST: int = 100
+    RATELIMIT_UPLOAD_BYTES: int = 256 * 1024 * 1024  # bytes in flight (256 MiB), one bigger upload is allowed alone
+    RATELIMIT_UPLOAD_MIN_BYTES: int = 64 * 1024  # smaller bodies aren't counted
+    RATELIMIT_UPLOAD_RETRY_AFTER: int = 5  # seconds
+    RATELIMIT_UPLOAD_LEASE_SECONDS: int = 3600  # upload bytes of crashed worker are freed after it
 
     # Database
     # DB_USER: str = "tolikdemchuk"
@@ -43,6 +80,21 @@ class Settings(BaseSettings):
     # )
 
     SQLALCHEMY_DATABASE_URI: str = Field(..., env='DATABASE_URL')
+    # Read replicas for browse, search and downloads, json list: DATABASE_REPLICA_URLS='["postgresql://..."]'
+    SQLALCHEMY_REPLICA_URIS: List[str] = Field([], env='DATABASE_REPLICA_URLS')
+    # Client reads from primary for some time after write (replication lag)
+    DB_PRIMARY_COOKIE_KEY: str = "db_primary"
+    DB_PRIMARY_COOKIE_EXPIRES: int = 5  # seconds
+    DB_POOL_SIZE: int = 5  # connections per worker
+    DB_POOL_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30  # seconds to wait for free connection
+    DB_POOL_RECYCLE: int = 1800  # seconds (30 minutes)
+    DB_POOL_PRE_PING: bool = True
+    DB_CONNECT_TIMEOUT: int = 5  # seconds
+    DB_STATEMENT_TIMEOUT: int = 30000  # milliseconds, 0 - disabled
+    DB_LOCK_TIMEOUT: int = 10000  # milliseconds, 0 - disabled
+    DB_QUERY_CACHE_SIZE: int = 1000  # compiled statements per engine
+    DB_PREPARED_STATEMENT_CACHE_SIZE: int = 256  # prepared statements per connection, 0 - disabled
 
 
 @lru_cache()
@@ -0,0 +1,143 @@
+import io
+import os
+import time
+import tarfile
+import zipfile
+from typing import IO, Iterable, Iterator, List, Optional, Set, Tuple
+
+from app.config import settings
+from app.lib.files import iter_file
+from app.lib.blobs import stage_blob
+
+
+# Write-only stream, zipfile writes archive into it and generator takes written bytes
+class StreamBuffer(io.RawIOBase):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(entries: Iterable[Tuple[str, str, float]]) -> Iterator[bytes]:
+    # Entries are (path, name in archive, modification timestamp)
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for path, name, mtime in entries:
+            try:
+                src = open(path, 'rb')
+            except FileNotFoundError:
+                continue
+            with src:
+                info = zipfile.ZipInfo(name, date_time=time.gmtime(mtime)[:6])
+                force_zip64 = os.fstat(src.fileno()).st_size >= zipfile.ZIP64_LIMIT
+                with archive.open(info, mode='w', force_zip64=force_zip64) as dest:
+                    while chunk := src.read(settings.FILES_DOWNLOAD_CHUNK_SIZE):
+                        dest.write(chunk)
+                        yield buffer.pop()
+            yield buffer.pop()
+    # Central directory
+    yield buffer.pop()
+
+
+def iter_tar(entries: Iterable[Tuple[str, str, float]]) -> Iterator[bytes]:
+    length = 0
+    for path, name, mtime in entries:
+        try:
+            src = open(path, 'rb')
+        except FileNotFoundError:
+            continue
+        with src:
+            info = tarfile.TarInfo(name)
+            info.size = os.fstat(src.fileno()).st_size
+            info.mtime = int(mtime)
+            info.mode = 0o644
+            header = info.tobuf(format=tarfile.PAX_FORMAT)
+            length += len(header)
+            yield header
+            written = 0
+            while written < info.size and (chunk := src.read(min(settings.FILES_DOWNLOAD_CHUNK_SIZE, info.size - written))):
+                written += len(chunk)
+                yield chunk
+            # File could be truncated while archive is sent, keep sizes from header
+            if written < info.size:
+                yield tarfile.NUL * (info.size - written)
+            padding = -info.size % tarfile.BLOCKSIZE
+            length += info.size + padding
+            yield tarfile.NUL * padding
+    # End of archive, two empty blocks padded to record size
+    ending = 2 * tarfile.BLOCKSIZE
+    ending += -(length + ending) % tarfile.RECORDSIZE
+    yield tarfile.NUL * ending
+
+
+def get_seekable_file(file):
+    # SpooledTemporaryFile has no seekable() before python 3.11, zipfile needs it
+    return getattr(file, "_file", file)
+
+
+def list_archive(file) -> Optional[List[str]]:
+    # Names of regular files in zip or tar archive, None if file isn't an archive
+    file = get_seekable_file(file)
+    try:
+        if zipfile.is_zipfile(file):
+            file.seek(0)
+            with zipfile.ZipFile(file) as archive:
+                names = [info.filename for info in archive.infolist() if not info.is_dir()]
+        else:
+            file.seek(0)
+            with tarfile.open(fileobj=file, mode="r:*") as archive:
+                names = [member.name for member in archive if member.isfile()]
+    except (zipfile.BadZipFile, tarfile.TarError):
+        return None
+    # Folders are flat, directories inside archive are dropped
+    return [os.path.basename(name) for name in names if os.path.basename(name)]
+
+
+def iter_archive(file) -> Iterator[Tuple[str, IO[bytes]]]:
+    file = get_seekable_file(file)
+    if zipfile.is_zipfile(file):
+        file.seek(0)
+        with zipfile.ZipFile(file) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and os.path.basename(info.filename):
+                    with archive.open(info) as src:
+                        yield os.path.basename(info.filename), src
+    else:
+        file.seek(0)
+        with tarfile.open(fileobj=file, mode="r:*") as archive:
+            for member in archive:
+                if member.isfile() and os.path.basename(member.name):
+                    yield os.path.basename(member.name), archive.extractfile(member)
+
+
+def extract_archive(
+        file,
+        names: Set[str]
+) -> Tuple[List[Tuple[str, str, str, int]], List[str]]:
+    # Returns extracted files as (name, temporary path, digest, size) and names which failed
+    extracted = []
+    failed = []
+    names = set(names)
+    for name, src in iter_archive(file):
+        if name not in names:
+            continue
+        names.remove(name)
+        try:
+            tmp_path, digest, size = stage_blob(iter_file(src))
+        except Exception:
+            failed.append(name)
+            continue
+        extracted.append((name, tmp_path, digest, size))
+    return extracted, failed
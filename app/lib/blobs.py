@@ -0,0 +1,70 @@
+import os
+import hashlib
+from uuid import uuid4
+from typing import Iterable, List, Tuple
+
+
+def get_blob_path(digest: str):
+    full_path = os.path.join(os.getcwd(), f"app/folders/.blobs/{digest[:2]}/{digest}")
+    return full_path
+
+
+def stage_blob(chunks: Iterable[bytes]) -> Tuple[str, str, int]:
+    # Content is written to temporary file, it's stored as blob only after file is saved in database
+    tmp_dir = os.path.join(os.getcwd(), "app/folders/.blobs/tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    tmp_path = os.path.join(tmp_dir, uuid4().hex)
+    digest = hashlib.sha256()
+    length = 0
+    try:
+        # Hash content while it's written
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                digest.update(chunk)
+                f.write(chunk)
+                length += len(chunk)
+    except Exception:
+        discard_blob(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), length
+
+
+def store_blob(tmp_path: str, digest: str):
+    blob_path = get_blob_path(digest)
+    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+    # Store content only once, link fails if blob already exists
+    try:
+        os.link(tmp_path, blob_path)
+    except FileExistsError:
+        pass
+
+
+def discard_blob(tmp_path: str):
+    try:
+        os.remove(tmp_path)
+    except FileNotFoundError:
+        pass
+
+
+def link_blob(blob_path: str, user_id: int, folder_name: str, file_name: str):
+    full_path = os.path.join(os.getcwd(), f"app/folders/{user_id}/{folder_name}/{file_name}")
+    # Files in user folders are hard links to blob, so rename and move work as before
+    tmp_path = f"{full_path}.{uuid4().hex}.tmp"
+    os.link(blob_path, tmp_path)
+    os.replace(tmp_path, full_path)
+
+
+def delete_blobs(digests: List[str]):
+    # Called after files of released blobs are removed from user folders
+    for digest in digests:
+        blob_path = get_blob_path(digest)
+        del_path = f"{blob_path}.{uuid4().hex}.del"
+        try:
+            os.rename(blob_path, del_path)
+        except FileNotFoundError:
+            continue
+        # Blob was stored again by concurrent upload and is linked from user folder, put it back
+        if os.stat(del_path).st_nlink > 1:
+            os.replace(del_path, blob_path)
+        else:
+            os.remove(del_path)
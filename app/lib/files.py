@@ -1,24 +1,54 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
 
+from app.config import settings
+from app.lib.blobs import get_blob_path, stage_blob, store_blob, link_blob, discard_blob
 
-def save_file(
-        user_id: int,
-        folder_name: str,
-        file_name: str,
-        file
-):
-    file_path = f"app/folders/{user_id}/{folder_name}/{file_name}"
-    full_path = os.path.join(os.getcwd(), file_path)
+
+# Shared by all requests of worker, so parallel storage operations are bounded
+storage_executor = ThreadPoolExecutor(max_workers=settings.FILES_STORAGE_WORKERS, thread_name_prefix="storage")
+
+
+def get_file_name(full_name: str):
+    # File name without extension
+    return ".".join(full_name.split(".")[:-1])
+
+
+def is_valid_file_name(full_name: str) -> bool:
+    # Name is used as path in user folder, it can't point outside of it
+    if full_name in ("", ".", "..") or "\x00" in full_name:
+        return False
+    return os.path.basename(full_name) == full_name and "\\" not in full_name
+
+
+def iter_file(file, chunk_size: int = settings.FILES_UPLOAD_CHUNK_SIZE):
+    while chunk := file.read(chunk_size):
+        yield chunk
+
+
+def stage_file(file, chunk_size: int = settings.FILES_UPLOAD_CHUNK_SIZE):
     try:
-        contents = file.read()
-        with open(full_path, 'wb') as f:
-            f.write(contents)
+        # Stream file to temporary storage by chunks, so memory usage doesn't depend on file size
+        return stage_blob(iter_file(file, chunk_size))
     except Exception:
         return {"message": "There was an error uploading the file"}
     finally:
-        length = len(contents)
         file.close()
-        return length
+
+
+def store_file(tmp_path: str, digest: str, user_id: int, folder_name: str, file_name: str):
+    # Called after file is saved in database, so existing file can't be replaced
+    try:
+        store_blob(tmp_path, digest)
+        try:
+            link_blob(get_blob_path(digest), user_id, folder_name, file_name)
+        except FileNotFoundError:
+            # Released blob was removed by concurrent delete, staged content is linked and stored again
+            link_blob(tmp_path, user_id, folder_name, file_name)
+            store_blob(tmp_path, digest)
+    finally:
+        discard_blob(tmp_path)
 
 
 def rename_file(old_name: str, new_name: str, folder_name: str, user_id: int):
@@ -32,6 +62,16 @@ def delete_storage_file(user_id: int, folder_name: str, file_name: str):
     os.remove(full_path)
 
 
+def delete_storage_files(user_id: int, files: List[Tuple[str, str]]):
+    # Files are (folder name, file name), unlinks are run in parallel
+    def _delete(elem):
+        try:
+            delete_storage_file(user_id, *elem)
+        except FileNotFoundError:
+            pass
+    list(storage_executor.map(_delete, files))
+
+
 def get_path_to_file(folder_name: str, file_name: str, user_id: int):
     full_path = os.path.join(os.getcwd(), f"app/folders/{user_id}/{folder_name}/{file_name}")
     return full_path
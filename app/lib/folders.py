@@ -1,5 +1,8 @@
 import os
 import shutil
+from typing import Callable, List
+
+from app.lib.files import storage_executor
 
 
 def create_main_dir(user_id: int):
@@ -11,7 +14,8 @@ def create_main_dir(user_id: int):
 def create_dir(name: str, user_id: int):
     folder_name = f"app/folders/{user_id}/{name}"
     full_path = os.path.join(os.getcwd(), folder_name)
-    os.mkdir(full_path)
+    # Dir can be left by failed batch, whose folder rows were rolled back
+    os.makedirs(full_path, exist_ok=True)
 
 
 def rename_dir(old_name: str, new_name: str, user_id: int):
@@ -26,3 +30,16 @@ def delete_dir(name: str, user_id: int):
     folder_name = f"app/folders/{user_id}/{name}"
     full_path = os.path.join(os.getcwd(), folder_name)
     shutil.rmtree(full_path, ignore_errors=True)
+
+
+def run_for_dirs(func: Callable[[str, int], None], names: List[str], user_id: int):
+    # Directories are created or removed in parallel by shared storage threads
+    list(storage_executor.map(lambda name: func(name, user_id), names))
+
+
+def create_dirs(names: List[str], user_id: int):
+    run_for_dirs(create_dir, names, user_id)
+
+
+def delete_dirs(names: List[str], user_id: int):
+    run_for_dirs(delete_dir, names, user_id)
@@ -0,0 +1,34 @@
+import hmac
+import json
+import base64
+import hashlib
+import binascii
+from datetime import datetime
+from typing import Any, List, Optional
+
+from app.config import settings
+
+
+def sign_cursor(data: str) -> str:
+    # Cursor values go to database as they are, so only cursors made by server are accepted
+    signature = hmac.new(settings.SECURITY_SECRET_KEY.encode(), data.encode(), hashlib.sha256).digest()[:16]
+    return base64.urlsafe_b64encode(signature).decode().rstrip("=")
+
+
+def encode_cursor(values: List[Any]) -> str:
+    # Values of sort keys of the last row on page
+    data = [{"dt": value.isoformat()} if isinstance(value, datetime) else value for value in values]
+    data = json.dumps(data, separators=(",", ":")).encode()
+    data = base64.urlsafe_b64encode(data).decode().rstrip("=")
+    return f"{data}.{sign_cursor(data)}"
+
+
+def decode_cursor(cursor: str) -> Optional[List[Any]]:
+    data, _, signature = cursor.partition(".")
+    if not hmac.compare_digest(signature.encode(), sign_cursor(data).encode()):
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(data + "=" * (-len(data) % 4)))
+        return [datetime.fromisoformat(value["dt"]) if isinstance(value, dict) else value for value in data]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        return None
@@ -0,0 +1,104 @@
+import time
+import sqlite3
+import threading
+from typing import Optional
+
+from app.config import settings
+
+
+RATELIMIT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_leases_key ON leases (key);
+"""
+
+
+# Token buckets and in-flight leases in sqlite file, so all workers of host share limits.
+# Calls are blocking, run them in thread pool.
+class RateLimiter:
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        self.rejected_requests = 0
+        self.rejected_uploads = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connection per thread, transactions are managed explicitly
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Limits are lost on power failure only
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.executescript(RATELIMIT_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> float:
+        # Returns 0 if tokens are taken, otherwise seconds until bucket has them
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + max(now - row[1], 0) * rate)
+            if tokens < cost:
+                conn.execute("ROLLBACK")
+                self.rejected_requests += 1
+                return (cost - tokens) / rate
+            conn.execute(
+                "INSERT INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                (key, tokens - cost, now)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return 0.0
+
+    def acquire(self, key: str, size: int, limit: int, lease_seconds: int) -> Optional[int]:
+        # Returns lease id or None if size doesn't fit into limit, release lease when upload is done
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            conn.execute("DELETE FROM leases WHERE key = ? AND expires_at <= ?", (key, now))
+            in_flight = conn.execute("SELECT coalesce(sum(size), 0) FROM leases WHERE key = ?", (key,)).fetchone()[0]
+            if in_flight and in_flight + size > limit:
+                conn.execute("ROLLBACK")
+                self.rejected_uploads += 1
+                return None
+            lease_id = conn.execute(
+                "INSERT INTO leases (key, size, expires_at) VALUES (?, ?, ?)",
+                (key, size, now + lease_seconds)
+            ).lastrowid
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return lease_id
+
+    def release(self, lease_id: int) -> None:
+        self._connect().execute("DELETE FROM leases WHERE id = ?", (lease_id,))
+
+    def get_metrics(self) -> dict:
+        return {
+            "rejected_requests": self.rejected_requests,
+            "rejected_uploads": self.rejected_uploads
+        }
+
+
+rate_limiter = RateLimiter(settings.RATELIMIT_DB_PATH)
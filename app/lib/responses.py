@@ -0,0 +1,243 @@
+import os
+import stat
+import calendar
+from uuid import uuid4
+from typing import List, Mapping, Optional, Tuple
+from urllib.parse import quote
+from email.utils import formatdate, parsedate_to_datetime
+
+import anyio
+from fastapi.responses import FileResponse
+from starlette.datastructures import Headers
+from starlette.types import Receive, Scope, Send
+
+from app.config import settings
+
+
+def get_content_disposition(filename: str) -> str:
+    # Same as FileResponse, headers are latin-1, other names are percent-encoded
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def get_file_validators(file) -> Tuple[str, str]:
+    modified_at = file.updated_at or file.created_at
+    modified_at = calendar.timegm(modified_at.timetuple())
+    # Content digest is the best validator, files stored before blob storage use metadata
+    if file.digest:
+        etag = f'"{file.digest}"'
+    else:
+        etag = f'"{file.id}-{file.size}-{modified_at}"'
+    return etag, formatdate(modified_at, usegmt=True)
+
+
+def is_not_modified(request_headers: Headers, etag: str, last_modified: str) -> bool:
+    # If-None-Match has priority over If-Modified-Since (RFC 7232)
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        # Weak comparison
+        return etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            if_modified_since = parsedate_to_datetime(if_modified_since)
+            return parsedate_to_datetime(last_modified) <= if_modified_since
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range_header(range_header: str, file_size: int) -> Optional[List[Tuple[int, int]]]:
+    # Returns None if header must be ignored and empty list if it's unsatisfiable
+    unit, _, specs = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs:
+        return None
+    ranges = []
+    for spec in specs.split(","):
+        start, sep, end = spec.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if not start:
+                # Suffix range, last N bytes
+                length = int(end)
+                # Empty file has no last bytes
+                if length <= 0 or file_size == 0:
+                    continue
+                ranges.append((max(file_size - length, 0), file_size - 1))
+                continue
+            start = int(start)
+            end = int(end) if end else None
+        except ValueError:
+            return None
+        if start < 0 or (end is not None and end < start):
+            return None
+        if start < file_size:
+            ranges.append((start, file_size - 1 if end is None else min(end, file_size - 1)))
+    # Merge overlapping and adjacent ranges
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+# FileResponse with byte ranges support (RFC 7233).
+# Single range is sent as 206 response, multiple ranges as multipart/byteranges.
+class RangeFileResponse(FileResponse):
+    chunk_size = settings.FILES_DOWNLOAD_CHUNK_SIZE
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.headers.setdefault("accept-ranges", "bytes")
+
+    def if_range_matches(self, if_range: Optional[str]) -> bool:
+        if if_range is None:
+            return True
+        if_range = if_range.strip()
+        # Weak validators can't be used for ranges
+        if if_range.startswith("W/"):
+            return False
+        if if_range.strip('"') == self.headers.get("etag", "").strip('"'):
+            return True
+        return if_range == self.headers.get("last-modified")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.stat_result is None:
+            try:
+                self.stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+                self.set_stat_headers(self.stat_result)
+            except FileNotFoundError:
+                raise RuntimeError(f"File at path {self.path} does not exist.")
+            else:
+                if not stat.S_ISREG(self.stat_result.st_mode):
+                    raise RuntimeError(f"File at path {self.path} is not a file.")
+        file_size = self.stat_result.st_size
+        request_headers = Headers(scope=scope)
+        range_header = request_headers.get("range")
+        ranges = None
+        if range_header and self.if_range_matches(request_headers.get("if-range")):
+            ranges = parse_range_header(range_header, file_size)
+        # Whole file
+        if ranges is None:
+            await self.send_ranges(scope, self.status_code, [(b"", 0, file_size - 1)], b"", send)
+            if self.background is not None:
+                await self.background()
+            return
+        # Unsatisfiable
+        if not ranges:
+            await self.send_range_not_satisfiable(file_size, send)
+            return
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            self.headers["content-range"] = f"bytes {start}-{end}/{file_size}"
+            self.headers["content-length"] = str(end - start + 1)
+            await self.send_ranges(scope, 206, [(b"", start, end)], b"", send)
+        else:
+            boundary = uuid4().hex
+            content_type = self.headers.get("content-type", self.media_type)
+            parts = [
+                (
+                    f"--{boundary}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n".encode("latin-1"),
+                    start,
+                    end
+                )
+                for start, end in ranges
+            ]
+            ending = f"--{boundary}--\r\n".encode("latin-1")
+            content_length = len(ending) + sum(len(header) + end - start + 1 + 2 for header, start, end in parts)
+            self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+            self.headers["content-length"] = str(content_length)
+            await self.send_ranges(scope, 206, parts, ending, send)
+        if self.background is not None:
+            await self.background()
+
+    async def send_range_not_satisfiable(self, file_size: int, send: Send) -> None:
+        headers = [
+            (b"content-range", f"bytes */{file_size}".encode("latin-1")),
+            (b"content-length", b"0")
+        ]
+        await send({"type": "http.response.start", "status": 416, "headers": headers})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def send_ranges(
+            self,
+            scope: Scope,
+            status_code: int,
+            parts: List[Tuple[bytes, int, int]],
+            ending: bytes,
+            send: Send
+    ) -> None:
+        await send({"type": "http.response.start", "status": status_code, "headers": self.raw_headers})
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        multipart = len(parts) > 1
+        # Server can send file straight from page cache with sendfile
+        zero_copy = "http.response.zerocopysend" in scope.get("extensions", {})
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            for header, start, end in parts:
+                if header:
+                    await send({"type": "http.response.body", "body": header, "more_body": True})
+                if zero_copy:
+                    await send(
+                        {
+                            "type": "http.response.zerocopysend",
+                            "file": file.wrapped,
+                            "offset": start,
+                            "count": end - start + 1,
+                            "more_body": True
+                        }
+                    )
+                else:
+                    await self.send_file_range(file, start, end, send)
+                if multipart:
+                    await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+        await send({"type": "http.response.body", "body": ending, "more_body": False})
+
+    async def send_file_range(self, file, start: int, end: int, send: Send) -> None:
+        await file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await file.read(min(self.chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+
+# File is sent by front server (nginx X-Accel-Redirect or X-Sendfile),
+# application only checks permissions and sends headers.
+class OffloadFileResponse(FileResponse):
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if settings.FILES_DOWNLOAD_OFFLOAD == "x-accel-redirect":
+            root = os.path.join(os.getcwd(), "app/folders")
+            uri = settings.FILES_DOWNLOAD_OFFLOAD_PREFIX.rstrip("/") + "/" + quote(os.path.relpath(self.path, root))
+            self.headers["x-accel-redirect"] = uri
+        else:
+            self.headers["x-sendfile"] = os.fspath(self.path)
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+        if self.background is not None:
+            await self.background()
+
+
+def file_response(
+        path: str,
+        media_type: str,
+        filename: str,
+        headers: Optional[Mapping[str, str]] = None
+) -> FileResponse:
+    if settings.FILES_DOWNLOAD_OFFLOAD:
+        return OffloadFileResponse(path, media_type=media_type, filename=filename, headers=headers)
+    return RangeFileResponse(path, media_type=media_type, filename=filename, headers=headers)
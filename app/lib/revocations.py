@@ -0,0 +1,87 @@
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# Loader gets timestamp and returns user revocations made after it and sessions which aren't expired
+RevocationsLoader = Callable[[float], Awaitable[Tuple[Iterable[Tuple[int, float]], Iterable[Tuple[str, float]]]]]
+
+
+# Revoked users (user id -> revocation timestamp, tokens issued before it aren't accepted)
+# and revoked sessions (session id -> expiration timestamp), per worker process.
+# User entries older than max age are dropped, all tokens issued before them are expired.
+class RevocationList:
+
+    def __init__(self, max_age: float) -> None:
+        self.max_age = max_age
+        self._revoked: Dict[int, float] = {}
+        self._sessions: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.refreshed_at: Optional[float] = None
+        self.failures = 0
+
+    def revoke(self, user_id: int, revoked_at: float) -> None:
+        if revoked_at > self._revoked.get(user_id, 0.0):
+            self._revoked[user_id] = revoked_at
+
+    def revoke_session(self, session_id: str, expires_at: float) -> None:
+        if expires_at > self._sessions.get(session_id, 0.0):
+            self._sessions[session_id] = expires_at
+
+    def is_revoked(self, user_id: int, issued_at: float, session_id: Optional[str] = None) -> bool:
+        if session_id is not None and session_id in self._sessions:
+            return True
+        revoked_at = self._revoked.get(user_id)
+        return revoked_at is not None and issued_at <= revoked_at
+
+    def update(
+            self,
+            items: Iterable[Tuple[int, float]],
+            sessions: Iterable[Tuple[str, float]] = ()
+    ) -> None:
+        # Loaded entries are merged, so revocations made by this worker during load are kept
+        for user_id, revoked_at in items:
+            self.revoke(user_id, revoked_at)
+        for session_id, expires_at in sessions:
+            self.revoke_session(session_id, expires_at)
+        now = time.time()
+        oldest = now - self.max_age
+        self._revoked = {user_id: revoked_at for user_id, revoked_at in self._revoked.items() if revoked_at > oldest}
+        self._sessions = {
+            session_id: expires_at for session_id, expires_at in self._sessions.items() if expires_at > now
+        }
+        self.refreshed_at = now
+
+    async def _refresh_forever(self, loader: RevocationsLoader, interval: float) -> None:
+        while True:
+            try:
+                self.update(*await loader(time.time() - self.max_age))
+            except Exception:
+                # Previous entries are used until database is available
+                self.failures += 1
+                logger.exception("Token revocations refresh failed")
+            await asyncio.sleep(interval)
+
+    def start(self, loader: RevocationsLoader, interval: float) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._refresh_forever(loader, interval))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_metrics(self) -> dict:
+        return {
+            "size": len(self._revoked),
+            "sessions": len(self._sessions),
+            "refreshed_at": self.refreshed_at,
+            "failures": self.failures
+        }
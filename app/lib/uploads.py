@@ -0,0 +1,96 @@
+import os
+import shutil
+import contextlib
+from uuid import uuid4
+from typing import AsyncIterator, Dict, List
+
+import anyio
+
+from app.lib.files import iter_file
+from app.lib.blobs import stage_blob
+
+
+def get_session_dir(user_id: int, session_id: str):
+    full_path = os.path.join(os.getcwd(), f"app/folders/{user_id}/.uploads/{session_id}")
+    return full_path
+
+
+def get_chunk_path(user_id: int, session_id: str, index: int):
+    full_path = os.path.join(get_session_dir(user_id, session_id), str(index))
+    return full_path
+
+
+def create_session_dir(user_id: int, session_id: str):
+    os.makedirs(get_session_dir(user_id, session_id))
+
+
+def delete_session_dir(user_id: int, session_id: str):
+    shutil.rmtree(get_session_dir(user_id, session_id), ignore_errors=True)
+
+
+def get_session_dirs(user_id: int) -> List[str]:
+    full_path = os.path.join(os.getcwd(), f"app/folders/{user_id}/.uploads")
+    if not os.path.isdir(full_path):
+        return []
+    return os.listdir(full_path)
+
+
+def get_received_chunks(user_id: int, session_id: str) -> Dict[int, int]:
+    chunks = {}
+    # Missing session dir has no received chunks
+    with contextlib.suppress(FileNotFoundError), os.scandir(get_session_dir(user_id, session_id)) as entries:
+        for entry in entries:
+            # Skip chunks which are still being written
+            if entry.name.isdigit():
+                chunks[int(entry.name)] = entry.stat().st_size
+    return chunks
+
+
+async def save_chunk(
+        user_id: int,
+        session_id: str,
+        index: int,
+        size: int,
+        stream: AsyncIterator[bytes]
+) -> bool:
+    chunk_path = get_chunk_path(user_id, session_id, index)
+    # Unique temporary name, so parallel retries of the same chunk don't clash
+    part_path = f"{chunk_path}.{uuid4().hex}.part"
+    length = 0
+    try:
+        async with await anyio.open_file(part_path, 'wb') as f:
+            async for data in stream:
+                length += len(data)
+                if length > size:
+                    break
+                await f.write(data)
+    except Exception:
+        length = -1
+    if length != size:
+        # Part file isn't created if session dir is missing
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(part_path)
+        return False
+    # Chunk becomes visible only when it's completely written
+    try:
+        os.replace(part_path, chunk_path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def iter_chunks(user_id: int, session_id: str, chunks: int):
+    for index in range(chunks):
+        with open(get_chunk_path(user_id, session_id, index), 'rb') as chunk:
+            yield from iter_file(chunk)
+
+
+def assemble_chunks(
+        user_id: int,
+        session_id: str,
+        chunks: int
+):
+    try:
+        return stage_blob(iter_chunks(user_id, session_id, chunks))
+    except Exception:
+        return {"message": "There was an error assembling the file"}
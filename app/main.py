@@ -3,6 +3,9 @@ from starlette.middleware.cors import CORSMiddleware
 
 from app.config import settings
 from app.api import router
+from app.api.middleware import UploadAdmissionMiddleware
+from app.api.dependencies.security import start_revocations_refresh, stop_revocations_refresh
+from app.lib.security import password_hasher
 
 
 def get_application() -> FastAPI:
@@ -11,7 +14,8 @@ def get_application() -> FastAPI:
         title=settings.PROJECT_NAME,
         version=settings.PROJECT_VERSION
     )
-    # Middleware
+    # Middleware, last added is outer, so 429 of uploads has cors headers
+    application.add_middleware(UploadAdmissionMiddleware)
     application.add_middleware(
         CORSMiddleware,
         allow_origins=settings.ALLOWED_HOSTS or ["*"],
@@ -21,6 +25,11 @@ def get_application() -> FastAPI:
     )
     # Include main router
     application.include_router(router)
+    # Revocations of access tokens are loaded in background
+    application.add_event_handler("startup", start_revocations_refresh)
+    application.add_event_handler("shutdown", stop_revocations_refresh)
+    # Stop password hashing processes
+    application.add_event_handler("shutdown", password_hasher.shutdown)
 
     return application
 
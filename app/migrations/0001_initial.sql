@@ -0,0 +1,69 @@
+-- Schema created by create_all before migrations, existing databases are adopted as is
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE TABLE IF NOT EXISTS "Users" (
+    id INTEGER GENERATED ALWAYS AS IDENTITY,
+    username VARCHAR(63) NOT NULL,
+    password TEXT NOT NULL,
+    full_name VARCHAR(128) NOT NULL,
+    age INTEGER,
+    scopes TEXT[],
+    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+    PRIMARY KEY (id),
+    UNIQUE (username)
+);
+
+CREATE TABLE IF NOT EXISTS "Folders" (
+    id INTEGER GENERATED ALWAYS AS IDENTITY,
+    name VARCHAR(63) NOT NULL,
+    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY (user_id) REFERENCES "Users" (id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS "Blobs" (
+    digest VARCHAR(64) NOT NULL,
+    size BIGINT NOT NULL,
+    ref_count INTEGER NOT NULL,
+    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+    PRIMARY KEY (digest)
+);
+
+CREATE TABLE IF NOT EXISTS "Files" (
+    id INTEGER GENERATED ALWAYS AS IDENTITY,
+    name TEXT NOT NULL,
+    full_name TEXT NOT NULL,
+    size BIGINT NOT NULL,
+    type TEXT NOT NULL,
+    share BOOLEAN,
+    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+    updated_at TIMESTAMP WITHOUT TIME ZONE,
+    folder_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY (folder_id) REFERENCES "Folders" (id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES "Users" (id) ON DELETE CASCADE
+);
+
+-- Tables created before blob storage have no digest column
+ALTER TABLE "Files" ADD COLUMN IF NOT EXISTS digest VARCHAR(64) REFERENCES "Blobs" (digest);
+
+CREATE INDEX IF NOT EXISTS ix_files_name_trgm ON "Files" USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_files_full_name_trgm ON "Files" USING gin (full_name gin_trgm_ops);
+
+CREATE TABLE IF NOT EXISTS "UploadSessions" (
+    id VARCHAR(32) NOT NULL,
+    name TEXT NOT NULL,
+    full_name TEXT NOT NULL,
+    size BIGINT NOT NULL,
+    chunk_size INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+    expires_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    folder_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (id),
+    FOREIGN KEY (folder_id) REFERENCES "Folders" (id) ON DELETE CASCADE,
+    FOREIGN KEY (user_id) REFERENCES "Users" (id) ON DELETE CASCADE
+);
@@ -0,0 +1,14 @@
+-- Folder names are unique per user: check by name, rename, bulk create and delete
+CREATE UNIQUE INDEX ux_folders_user_id_name ON "Folders" (user_id, name);
+
+-- File names are unique per folder: check_file, batch upload and import
+CREATE UNIQUE INDEX ux_files_user_id_folder_id_name ON "Files" (user_id, folder_id, name);
+-- Browse pages and bulk delete of user files
+CREATE INDEX ix_files_user_id_id ON "Files" (user_id, id);
+-- Folder delete (cascade and digests of folder)
+CREATE INDEX ix_files_folder_id ON "Files" (folder_id);
+-- Blob delete checks references
+CREATE INDEX ix_files_digest ON "Files" (digest);
+
+CREATE INDEX ix_upload_sessions_user_id ON "UploadSessions" (user_id);
+CREATE INDEX ix_upload_sessions_expires_at ON "UploadSessions" (expires_at);
@@ -0,0 +1,2 @@
+-- Files are inserted before blob references, check digest at commit
+ALTER TABLE "Files" ALTER CONSTRAINT "Files_digest_fkey" DEFERRABLE INITIALLY DEFERRED;
@@ -0,0 +1,19 @@
+-- Logouts and deleted users, loaded by every worker to check access tokens
+CREATE TABLE "TokenRevocations" (
+    user_id INTEGER NOT NULL PRIMARY KEY,
+    revoked_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+);
+CREATE INDEX ix_token_revocations_revoked_at ON "TokenRevocations" (revoked_at);
+
+-- Tokens of deleted user are revoked
+CREATE FUNCTION revoke_deleted_user_tokens() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO "TokenRevocations" (user_id, revoked_at)
+    VALUES (OLD.id, now() AT TIME ZONE 'utc')
+    ON CONFLICT (user_id) DO UPDATE SET revoked_at = EXCLUDED.revoked_at;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER users_revoke_tokens AFTER DELETE ON "Users"
+FOR EACH ROW EXECUTE FUNCTION revoke_deleted_user_tokens();
@@ -0,0 +1,6 @@
+-- Logged out sessions, tokens of session are revoked until its last refresh token expires
+CREATE TABLE "RevokedSessions" (
+    session_id VARCHAR(32) NOT NULL PRIMARY KEY,
+    expires_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+);
+CREATE INDEX ix_revoked_sessions_expires_at ON "RevokedSessions" (expires_at);
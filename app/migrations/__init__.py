@@ -0,0 +1,48 @@
+import os
+from typing import List, Tuple
+
+from sqlalchemy import text
+
+from app.models import engine
+
+
+MIGRATIONS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Any constant, only one process applies migrations at a time
+MIGRATIONS_LOCK_ID = 20220601
+
+
+def get_migrations() -> List[Tuple[str, str]]:
+    # Migrations are sql files named <version>_<name>.sql, applied in order of versions
+    migrations = []
+    for file_name in sorted(os.listdir(MIGRATIONS_DIR)):
+        if file_name.endswith(".sql"):
+            migrations.append((file_name.split("_")[0], os.path.join(MIGRATIONS_DIR, file_name)))
+    return migrations
+
+
+async def migrate() -> List[str]:
+    applied = []
+    async with engine.begin() as conn:
+        # Index creation on big tables can take longer than statement timeout
+        await conn.execute(text("SET LOCAL statement_timeout = 0"))
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": MIGRATIONS_LOCK_ID})
+        await conn.execute(
+            text(
+                "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                "version VARCHAR(32) PRIMARY KEY, "
+                "applied_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now())"
+            )
+        )
+        versions = set((await conn.execute(text("SELECT version FROM schema_migrations"))).scalars())
+        raw_connection = await conn.get_raw_connection()
+        for version, path in get_migrations():
+            if version in versions:
+                continue
+            with open(path) as f:
+                sql = f.read()
+            # Prepared statements can't have many commands, file is sent as simple query
+            await raw_connection.driver_connection.execute(sql)
+            await conn.execute(text("INSERT INTO schema_migrations (version) VALUES (:version)"), {"version": version})
+            applied.append(os.path.basename(path))
+    return applied
@@ -0,0 +1,20 @@
+import asyncio
+
+from app.models import engine
+from app.migrations import migrate
+
+
+# Apply new migrations: python -m app.migrations
+async def main():
+    try:
+        applied = await migrate()
+    finally:
+        await engine.dispose()
+    for file_name in applied:
+        print(f"Applied {file_name}")
+    if not applied:
+        print("Database is up to date")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,17 +1,68 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import random
 
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql import Select
+
+from .pool import InstrumentedQueuePool
 from ..config import settings
 
 
+def get_async_database_uri(uri: str) -> str:
+    # Use asyncpg driver, if driver isn't set explicitly
+    for prefix in ("postgresql://", "postgres://"):
+        if uri.startswith(prefix):
+            return "postgresql+asyncpg://" + uri[len(prefix):]
+    return uri
+
+
 SQLALCHEMY_ENGINE_OPTIONS = {
     "echo": False,
     "future": True,
+    "query_cache_size": settings.DB_QUERY_CACHE_SIZE,
+    "poolclass": InstrumentedQueuePool,
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_POOL_MAX_OVERFLOW,
+    "pool_timeout": settings.DB_POOL_TIMEOUT,
+    "pool_recycle": settings.DB_POOL_RECYCLE,
+    "pool_pre_ping": settings.DB_POOL_PRE_PING,
     "connect_args": {
-        "connect_timeout": 5
+        "timeout": settings.DB_CONNECT_TIMEOUT,
+        # Server-side prepared statements per connection, must be 0 behind pgbouncer in transaction mode
+        "prepared_statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE,
+        "server_settings": {
+            "statement_timeout": str(settings.DB_STATEMENT_TIMEOUT),
+            "lock_timeout": str(settings.DB_LOCK_TIMEOUT),
+            "pg_trgm.similarity_threshold": str(settings.FILES_SEARCH_SIMILARITY_THRESHOLD)
+        }
     }
 }
 
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, **SQLALCHEMY_ENGINE_OPTIONS)
+engine = create_async_engine(get_async_database_uri(settings.SQLALCHEMY_DATABASE_URI), **SQLALCHEMY_ENGINE_OPTIONS)
+
+replica_engines = [
+    create_async_engine(get_async_database_uri(uri), **SQLALCHEMY_ENGINE_OPTIONS)
+    for uri in settings.SQLALCHEMY_REPLICA_URIS
+]
+
+
+# Statements marked with execution_options(use_replica=True) are sent to replica.
+# After first write session reads only from primary, so request sees its own writes.
+class RoutingSession(Session):
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if not isinstance(clause, Select):
+            self.info["use_primary"] = True
+        elif (
+                replica_engines
+                and not self.info.get("use_primary")
+                and clause.get_execution_options().get("use_replica")
+        ):
+            # Same replica for whole session
+            if "replica" not in self.info:
+                self.info["replica"] = random.choice(replica_engines).sync_engine
+            return self.info["replica"]
+        return super().get_bind(mapper, clause, **kwargs)
+
 
-session = sessionmaker(engine, expire_on_commit=False)
+session = sessionmaker(engine, class_=AsyncSession, sync_session_class=RoutingSession, expire_on_commit=False)
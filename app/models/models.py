@@ -4,7 +4,8 @@ from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy import (
     Column,
     Identity,
-    ForeignKey
+    ForeignKey,
+    Index
 )
 from sqlalchemy import (
     Integer,
@@ -16,8 +17,6 @@ from sqlalchemy import (
     Text
 )
 
-from app.models import engine
-
 
 Base = declarative_base()
 
@@ -34,6 +33,30 @@ class Users(Base):
     created_at = Column(DateTime, server_default=func.now())
 
 
+# Tokens of user issued before revoked_at (utc) aren't accepted, row stays after user is deleted
+class TokenRevocations(Base):
+    __tablename__ = "TokenRevocations"
+
+    user_id = Column(Integer, primary_key=True)
+    revoked_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_token_revocations_revoked_at", revoked_at),
+    )
+
+
+# Logged out session (sid claim of tokens), row is kept until its tokens expire (utc)
+class RevokedSessions(Base):
+    __tablename__ = "RevokedSessions"
+
+    session_id = Column(String(32), primary_key=True)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_revoked_sessions_expires_at", expires_at),
+    )
+
+
 class Folders(Base):
     __tablename__ = "Folders"
 
@@ -43,6 +66,19 @@ class Folders(Base):
     user_id = Column(Integer, ForeignKey(Users.id, ondelete='CASCADE'), nullable=False)
     user = relationship("Users", backref=backref("folders", lazy=True))
 
+    __table_args__ = (
+        Index("ux_folders_user_id_name", user_id, name, unique=True),
+    )
+
+
+class Blobs(Base):
+    __tablename__ = "Blobs"
+
+    digest = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, server_default=func.now())
+
 
 class Files(Base):
     __tablename__ = "Files"
@@ -55,9 +91,38 @@ class Files(Base):
     share = Column(Boolean, default=False)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, onupdate=func.now(), nullable=True)
+    # Blob reference is added after file is saved, so constraint is checked at commit
+    digest = Column(String(64), ForeignKey(Blobs.digest, deferrable=True, initially="DEFERRED"), nullable=True)
     folder_id = Column(Integer, ForeignKey(Folders.id, ondelete='CASCADE'), nullable=False)
     user_id = Column(Integer, ForeignKey(Users.id, ondelete='CASCADE'), nullable=False)
     folder = relationship("Folders", backref=backref("files", lazy=True))
 
+    # Schema is changed by migrations (app/migrations), indexes are listed here to keep models in sync
+    __table_args__ = (
+        Index("ux_files_user_id_folder_id_name", user_id, folder_id, name, unique=True),
+        Index("ix_files_user_id_id", user_id, id),
+        Index("ix_files_folder_id", folder_id),
+        Index("ix_files_digest", digest),
+        Index("ix_files_name_trgm", name, postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        Index("ix_files_full_name_trgm", full_name, postgresql_using="gin", postgresql_ops={"full_name": "gin_trgm_ops"}),
+    )
+
+
+class UploadSessions(Base):
+    __tablename__ = "UploadSessions"
+
+    id = Column(String(32), primary_key=True)
+    name = Column(Text, nullable=False)
+    full_name = Column(Text, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    type = Column(Text, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+    expires_at = Column(DateTime, nullable=False)
+    folder_id = Column(Integer, ForeignKey(Folders.id, ondelete='CASCADE'), nullable=False)
+    user_id = Column(Integer, ForeignKey(Users.id, ondelete='CASCADE'), nullable=False)
 
-Base.metadata.create_all(engine)
+    __table_args__ = (
+        Index("ix_upload_sessions_user_id", user_id),
+        Index("ix_upload_sessions_expires_at", expires_at),
+    )
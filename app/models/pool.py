@@ -0,0 +1,80 @@
+import time
+from bisect import bisect_left
+from typing import List
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+# Upper bounds of wait time buckets (seconds), last bucket is +Inf
+POOL_WAIT_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0]
+
+
+class Histogram:
+
+    def __init__(self, buckets: List[float]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def to_dict(self) -> dict:
+        # Cumulative counts, same as prometheus histogram
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip([*map(str, self.buckets), "+Inf"], self.counts):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {"buckets": buckets, "sum": self.total, "count": self.count}
+
+
+# Connection pool which counts waiting time for connection (per worker process)
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.wait_time = Histogram(POOL_WAIT_BUCKETS)
+        self.timeouts = 0
+        self.overflows = 0
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.wait_time.observe(time.perf_counter() - start)
+
+    def _inc_overflow(self) -> bool:
+        result = super()._inc_overflow()
+        # Connection above pool size will be opened
+        if result and self._overflow > 0:
+            self.overflows += 1
+        return result
+
+    def recreate(self):
+        # Pool is recreated on invalidation, keep counters
+        pool = super().recreate()
+        pool.wait_time = self.wait_time
+        pool.timeouts = self.timeouts
+        pool.overflows = self.overflows
+        return pool
+
+    def get_metrics(self) -> dict:
+        return {
+            "size": self.size(),
+            "max_overflow": self._max_overflow,
+            "checked_in": self.checkedin(),
+            "checked_out": self.checkedout(),
+            "overflow": max(self.overflow(), 0),
+            "overflows": self.overflows,
+            "timeouts": self.timeouts,
+            "wait_time": self.wait_time.to_dict()
+        }
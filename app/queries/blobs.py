@@ -0,0 +1,19 @@
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import update, delete
+
+from app.models.models import Blobs
+
+
+def insert_blobs_q():
+    q = insert(Blobs)
+    return q
+
+
+def update_blobs_q():
+    q = update(Blobs)
+    return q
+
+
+def delete_blobs_q():
+    q = delete(Blobs)
+    return q
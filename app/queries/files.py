@@ -1,5 +1,6 @@
 from sqlalchemy.future import select
-from sqlalchemy import insert, update, delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import bindparam, update, delete
 
 from app.models.models import Files
 
@@ -22,3 +23,24 @@ def update_files_q():
 def delete_file_q():
     q = delete(Files)
     return q
+
+
+# Hot statements are built once with bound parameters, values are passed on execute
+_select_file_by_id = select(Files).where(
+    Files.id == bindparam("file_id"),
+    Files.user_id == bindparam("user_id")
+)
+
+_select_file_by_name = select(Files).where(
+    Files.name == bindparam("name"),
+    Files.folder_id == bindparam("folder_id"),
+    Files.user_id == bindparam("user_id")
+)
+
+
+def select_file_by_id_q():
+    return _select_file_by_id
+
+
+def select_file_by_name_q():
+    return _select_file_by_name
@@ -1,5 +1,6 @@
 from sqlalchemy.future import select
-from sqlalchemy import insert, update, delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import bindparam, update, delete
 
 from app.models.models import Folders
 
@@ -22,3 +23,14 @@ def update_folders_q():
 def delete_folders_q():
     q = delete(Folders)
     return q
+
+
+# Hot statement is built once with bound parameters, values are passed on execute
+_select_folder_by_id = select(Folders).where(
+    Folders.id == bindparam("folder_id"),
+    Folders.user_id == bindparam("user_id")
+)
+
+
+def select_folder_by_id_q():
+    return _select_folder_by_id
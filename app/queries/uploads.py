@@ -0,0 +1,19 @@
+from sqlalchemy.future import select
+from sqlalchemy import insert, delete
+
+from app.models.models import UploadSessions
+
+
+def select_upload_sessions_q():
+    q = select(UploadSessions)
+    return q
+
+
+def insert_upload_sessions_q():
+    q = insert(UploadSessions)
+    return q
+
+
+def delete_upload_sessions_q():
+    q = delete(UploadSessions)
+    return q
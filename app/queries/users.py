@@ -1,7 +1,9 @@
 from sqlalchemy.future import select
-from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import update, delete
+from sqlalchemy import bindparam
 
-from app.models.models import Users
+from app.models.models import Users, TokenRevocations, RevokedSessions
 
 
 def select_user_q():
@@ -12,3 +14,43 @@ def select_user_q():
 def insert_user_q():
     q = insert(Users)
     return q
+
+
+def update_user_q():
+    q = update(Users)
+    return q
+
+
+def select_token_revocations_q():
+    q = select(TokenRevocations.user_id, TokenRevocations.revoked_at)
+    return q
+
+
+def insert_token_revocation_q():
+    q = insert(TokenRevocations)
+    return q
+
+
+def select_revoked_sessions_q():
+    q = select(RevokedSessions.session_id, RevokedSessions.expires_at)
+    return q
+
+
+def insert_revoked_session_q():
+    q = insert(RevokedSessions)
+    return q
+
+
+def delete_revoked_sessions_q():
+    q = delete(RevokedSessions)
+    return q
+
+
+# Hot statement is built once with bound parameters, value is passed on execute
+_select_user_by_username = select(Users).where(
+    Users.username == bindparam("username")
+)
+
+
+def select_user_by_username_q():
+    return _select_user_by_username
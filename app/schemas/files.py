@@ -29,3 +29,5 @@ class FileFiltersSchema(BaseModel):
 class FileBrowseSchema(BaseModel):
     name_pattern: Optional[str] = None
     filters: Optional[FileFiltersSchema] = None
+    limit: Optional[int] = None
+    cursor: Optional[str] = None
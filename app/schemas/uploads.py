@@ -0,0 +1,10 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class UploadSessionCreateSchema(BaseModel):
+    file_name: str
+    size: int
+    content_type: str = "application/octet-stream"
+    chunk_size: Optional[int] = None
@@ -17,13 +17,20 @@ class TokenSchema(BaseModel):
         orm_mode = True
 
 
-class UserSchema(BaseModel):
+# Fields of user which are carried by access token
+class UserClaimsSchema(BaseModel):
     id: int
     username: str
+    scopes: List[str]
+
+    class Config:
+        orm_mode = True
+
+
+class UserSchema(UserClaimsSchema):
     password: str
     full_name: str
     age: Optional[int] = None
-    scopes: List[str]
     created_at: datetime
 
     class Config:
@@ -1,10 +1,20 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 class BaseService:
-    def __init__(self, db_session: Session) -> None:
+    def __init__(self, db_session: AsyncSession) -> None:
         self._db_session = db_session
 
     @property
-    def db_session(self) -> Session:
+    def db_session(self) -> AsyncSession:
         return self._db_session
+
+
+# Request transaction shared by all services, writes are committed once at the end of request
+class UnitOfWork(BaseService):
+
+    async def commit(self) -> None:
+        await self.db_session.commit()
+
+    async def rollback(self) -> None:
+        await self.db_session.rollback()
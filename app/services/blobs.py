@@ -0,0 +1,72 @@
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Integer, String, column, values
+
+from . import BaseService
+from app.models.models import Blobs
+from app.queries.blobs import (
+    insert_blobs_q,
+    update_blobs_q,
+    delete_blobs_q
+)
+
+
+class BlobsService(BaseService):
+
+    async def add_references(
+            self,
+            blobs: List[Tuple[str, int]]
+    ):
+        # Aggregate references, so every blob row is updated once
+        counts = Counter(digest for digest, _ in blobs)
+        sizes = dict(blobs)
+        stmt = insert_blobs_q()
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Blobs.digest],
+            set_={"ref_count": Blobs.ref_count + stmt.excluded.ref_count}
+        )
+        await self.db_session.execute(
+            stmt,
+            [
+                {"digest": digest, "size": sizes[digest], "ref_count": count}
+                for digest, count in counts.items()
+            ]
+        )
+
+    async def release_references(
+            self,
+            digests: List[Optional[str]]
+    ) -> List[str]:
+        # Files stored before blob storage have no digest
+        counts = Counter(digest for digest in digests if digest)
+        if not counts:
+            return []
+        released = values(
+            column("digest", String),
+            column("count", Integer),
+            name="released"
+        ).data(
+            list(counts.items())
+        )
+        stmt = update_blobs_q(
+        ).where(
+            Blobs.digest == released.c.digest
+        ).values(
+            ref_count=Blobs.ref_count - released.c.count
+        ).execution_options(
+            synchronize_session=False
+        )
+        await self.db_session.execute(stmt)
+        # Remove unreferenced blobs
+        stmt = delete_blobs_q(
+        ).where(
+            Blobs.digest.in_(list(counts)),
+            Blobs.ref_count <= 0
+        ).returning(
+            Blobs.digest
+        ).execution_options(
+            synchronize_session=False
+        )
+        result = await self.db_session.execute(stmt)
+        return result.scalars().all()
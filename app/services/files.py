@@ -1,112 +1,186 @@
-from typing import Optional
+from typing import Any, List, Optional, Set, Tuple
+
+from sqlalchemy import Integer, and_, any_, bindparam, func, or_
+from sqlalchemy.dialects.postgresql import ARRAY
 
 from . import BaseService
-from app.models.models import Files
+from app.models.models import Files, Folders
 from app.queries.files import (
     insert_files_q,
     select_files_q,
+    select_file_by_id_q,
+    select_file_by_name_q,
     update_files_q,
     delete_file_q
 )
 
 
+# Unique index of file names in folder
+FILES_UNIQUE_NAME = [Files.user_id, Files.folder_id, Files.name]
+
+# Rows per insert, postgres limits number of bind parameters in one statement
+FILES_INSERT_BATCH_SIZE = 1000
+
+# Sort keys of browse
+BROWSE_SORT_KEYS = {
+    "name": Files.name,
+    "size": Files.size,
+    "type": Files.type,
+    "create_date": Files.created_at,
+    "modified_date": func.coalesce(Files.updated_at, Files.created_at)
+}
+
+
 class FilesService(BaseService):
 
-    def create_file(
+    async def create_file(
             self,
             name: str,
             full_name: str,
             size: int,
             _type: str,
             folder_id: int,
-            user_id: int
-    ):
-        self.db_session.close()
-        with self.db_session.begin():
+            user_id: int,
+            digest: Optional[str] = None
+    ) -> Optional[int]:
+        # Returns None if file with this name exists in folder
+        stmt = insert_files_q(
+        ).values(
+            name=name,
+            full_name=full_name,
+            size=size,
+            type=_type,
+            digest=digest,
+            folder_id=folder_id,
+            user_id=user_id
+        ).on_conflict_do_nothing(
+            index_elements=FILES_UNIQUE_NAME
+        ).returning(
+            Files.id
+        )
+        result = await self.db_session.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def create_files(
+            self,
+            files: List[dict]
+    ) -> Set[str]:
+        # Multi-row inserts, returns names of created files
+        names = set()
+        for index in range(0, len(files), FILES_INSERT_BATCH_SIZE):
             stmt = insert_files_q(
             ).values(
-                name=name,
-                full_name=full_name,
-                size=size,
-                type=_type,
-                folder_id=folder_id,
-                user_id=user_id
+                files[index:index + FILES_INSERT_BATCH_SIZE]
+            ).on_conflict_do_nothing(
+                index_elements=FILES_UNIQUE_NAME
+            ).returning(
+                Files.name
             )
-            self.db_session.execute(stmt)
+            result = await self.db_session.execute(stmt)
+            names.update(result.scalars())
+        return names
 
-    def check_file(
+    async def check_file(
             self,
             name: str,
             folder_id: int,
             user_id: int
+    ):
+        result = await self.db_session.execute(
+            select_file_by_name_q(),
+            {"name": name, "folder_id": folder_id, "user_id": user_id}
+        )
+        return result.scalar_one_or_none()
+
+    async def get_existing_names(
+            self,
+            names: List[str],
+            folder_id: int,
+            user_id: int
     ):
         stmt = select_files_q(
         ).where(
-            Files.name == name,
+            Files.name.in_(names),
             Files.folder_id == folder_id,
             Files.user_id == user_id
+        ).with_only_columns(
+            Files.name
         )
-        result = self.db_session.execute(stmt)
-        return result.scalar_one_or_none()
+        result = await self.db_session.execute(stmt)
+        return set(result.scalars())
 
-    def get_file_by_id(
+    async def get_file_by_id(
             self,
             file_id: int,
             user_id: int
     ):
-        stmt = select_files_q(
-        ).where(
-            Files.id == file_id,
-            Files.user_id == user_id
+        result = await self.db_session.execute(
+            select_file_by_id_q(),
+            {"file_id": file_id, "user_id": user_id}
         )
-        result = self.db_session.execute(stmt)
         return result.scalar_one_or_none()
 
-    def update_file_share(
+    async def update_file_share(
             self,
             file_id: int,
             share: bool
     ):
-        self.db_session.close()
-        with self.db_session.begin():
-            stmt = update_files_q(
-            ).where(
-                Files.id == file_id
-            ).values(
-                share=share
-            )
-            self.db_session.execute(stmt)
+        stmt = update_files_q(
+        ).where(
+            Files.id == file_id
+        ).values(
+            share=share
+        )
+        await self.db_session.execute(stmt)
 
-    def update_file_name(
+    async def update_file_name(
             self,
             file_id: int,
             file_name: str,
             full_name: str
     ):
-        self.db_session.close()
-        with self.db_session.begin():
-            stmt = update_files_q(
-            ).where(
-                Files.id == file_id
-            ).values(
-                name=file_name,
-                full_name=full_name
-            )
-            self.db_session.execute(stmt)
+        stmt = update_files_q(
+        ).where(
+            Files.id == file_id
+        ).values(
+            name=file_name,
+            full_name=full_name
+        )
+        await self.db_session.execute(stmt)
 
-    def delete_file(
+    async def delete_file(
             self,
             file_id
     ):
-        self.db_session.close()
-        with self.db_session.begin():
-            stmt = delete_file_q(
-            ).where(
-                Files.id == file_id
-            )
-            self.db_session.execute(stmt)
+        stmt = delete_file_q(
+        ).where(
+            Files.id == file_id
+        )
+        await self.db_session.execute(stmt)
+
+    async def delete_files(
+            self,
+            file_ids: List[int],
+            user_id: int
+    ):
+        # Single statement for any number of ids, returns deleted files with their folder names
+        stmt = delete_file_q(
+        ).where(
+            Files.id == any_(bindparam("file_ids", file_ids, type_=ARRAY(Integer))),
+            Files.user_id == user_id,
+            Folders.id == Files.folder_id
+        ).returning(
+            Files.id,
+            Files.full_name,
+            Files.digest,
+            Folders.name.label("folder_name")
+        ).execution_options(
+            synchronize_session=False
+        )
+        result = await self.db_session.execute(stmt)
+        return result.all()
 
-    def get_shared_file(
+    async def get_shared_file(
             self,
             file_id: int
     ):
@@ -114,37 +188,147 @@ class FilesService(BaseService):
         ).where(
             Files.id == file_id,
             Files.share == True
+        ).execution_options(
+            use_replica=True
         )
-        result = self.db_session.execute(stmt)
+        result = await self.db_session.execute(stmt)
         return result.scalar_one_or_none()
 
-    def update_folder_data(
+    async def update_folder_data(
             self,
             file_id: int,
             folder_id: int
     ):
-        self.db_session.close()
-        with self.db_session.begin():
-            stmt = update_files_q(
-            ).where(
-                Files.id == file_id
-            ).values(
-                folder_id=folder_id
-            )
-            self.db_session.execute(stmt)
+        stmt = update_files_q(
+        ).where(
+            Files.id == file_id
+        ).values(
+            folder_id=folder_id
+        )
+        await self.db_session.execute(stmt)
+
+    async def get_files_by_folder_id(
+            self,
+            folder_id: int,
+            user_id: int
+    ):
+        stmt = select_files_q(
+        ).where(
+            Files.folder_id == folder_id,
+            Files.user_id == user_id
+        ).order_by(
+            Files.id
+        ).execution_options(
+            use_replica=True
+        )
+        result = await self.db_session.execute(stmt)
+        return result.scalars().all()
 
-    def browse_files(
+    async def delete_folder_files(
+            self,
+            folder_id: int
+    ) -> List[Optional[str]]:
+        return await self.delete_folders_files([folder_id])
+
+    async def delete_folders_files(
+            self,
+            folder_ids: List[int]
+    ) -> List[Optional[str]]:
+        # Files are deleted before folders (not by cascade), so digests of all of them are released
+        stmt = delete_file_q(
+        ).where(
+            Files.folder_id.in_(folder_ids)
+        ).returning(
+            Files.digest
+        ).execution_options(
+            synchronize_session=False
+        )
+        result = await self.db_session.execute(stmt)
+        return result.scalars().all()
+
+    async def browse_files(
             self,
             user_id: int,
-            name_pattern: Optional[str] = None
+            name_pattern: Optional[str] = None,
+            sort: Optional[List[Tuple[str, bool]]] = None,
+            after: Optional[List[Any]] = None,
+            limit: int = 100
     ):
+        # Sort is list of (key, descending), id is always last key, so order is stable
+        keys = [(BROWSE_SORT_KEYS[key], desc) for key, desc in sort or []]
+        keys.append((Files.id, False))
         stmt = select_files_q(
+        ).join(
+            Folders, Folders.id == Files.folder_id
+        ).add_columns(
+            Folders.name.label("folder_name"),
+            *(expr.label(f"sort_{index}") for index, (expr, _) in enumerate(keys))
         ).where(
             Files.user_id == user_id
+        ).order_by(
+            *(expr.desc() if desc else expr.asc() for expr, desc in keys)
+        ).limit(
+            limit
+        ).execution_options(
+            use_replica=True
         )
         if name_pattern:
-            stmt.filter(
+            stmt = stmt.where(
                 Files.name.ilike(name_pattern)
             )
-        result = self.db_session.execute(stmt)
-        return result.scalars().all()
+        # Keyset pagination, rows after values of last row of previous page
+        if after:
+            clauses = []
+            for index, (expr, desc) in enumerate(keys):
+                clauses.append(
+                    and_(
+                        *(key == value for (key, _), value in zip(keys[:index], after)),
+                        expr < after[index] if desc else expr > after[index]
+                    )
+                )
+            stmt = stmt.where(or_(*clauses))
+        result = await self.db_session.execute(stmt)
+        return result.all()
+
+    async def search_files(
+            self,
+            user_id: int,
+            query: str,
+            fuzzy: bool = False,
+            limit: int = 50
+    ):
+        # Both modes can use trigram indexes, fuzzy mode matches by similarity instead of substring
+        if fuzzy:
+            condition = or_(
+                Files.name.op("%")(query),
+                Files.full_name.op("%")(query)
+            )
+        else:
+            pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            condition = or_(
+                Files.name.ilike(pattern, escape="\\"),
+                Files.full_name.ilike(pattern, escape="\\")
+            )
+        score = func.greatest(
+            func.similarity(Files.name, query),
+            func.similarity(Files.full_name, query)
+        ).label("score")
+        stmt = select_files_q(
+        ).join(
+            Folders, Folders.id == Files.folder_id
+        ).add_columns(
+            Folders.name.label("folder_name"),
+            score
+        ).where(
+            Files.user_id == user_id,
+            condition
+        ).order_by(
+            score.desc(),
+            Files.id
+        ).limit(
+            limit
+        ).execution_options(
+            use_replica=True
+        )
+        result = await self.db_session.execute(stmt)
+        return result.all()
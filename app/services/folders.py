@@ -1,7 +1,10 @@
+from typing import List, Optional, Set
+
 from . import BaseService
 from app.models.models import Folders
 from app.queries.folders import (
     select_folders_q,
+    select_folder_by_id_q,
     insert_folders_q,
     update_folders_q,
     delete_folders_q
@@ -10,89 +13,139 @@ from app.queries.folders import (
 
 class FoldersService(BaseService):
 
-    def get_folder_by_id(
+    async def get_folder_by_id(
             self,
             folder_id: int,
             user_id: int,
     ):
-        stmt = select_folders_q(
-        ).where(
-            Folders.id == folder_id,
-            Folders.user_id == user_id
+        result = await self.db_session.execute(
+            select_folder_by_id_q(),
+            {"folder_id": folder_id, "user_id": user_id}
         )
-        result = self.db_session.execute(stmt)
         return result.scalar_one_or_none()
 
-    def get_folders_by_user_id(
+    async def get_folders_by_user_id(
             self,
             user_id: int
     ):
         stmt = select_folders_q(
         ).where(
             Folders.user_id == user_id
+        ).execution_options(
+            use_replica=True
         )
-        result = self.db_session.execute(stmt)
+        result = await self.db_session.execute(stmt)
         return result.scalars()
 
-    def get_folder_by_name(
+    async def get_folder_by_name(
             self,
             name: str,
-            user_id: int
+            user_id: int,
+            for_update: bool = False
     ):
         stmt = select_folders_q(
         ).where(
             Folders.name == name,
             Folders.user_id == user_id
         )
-        result = self.db_session.execute(stmt)
+        if for_update:
+            stmt = stmt.with_for_update()
+        result = await self.db_session.execute(stmt)
         return result.scalar_one_or_none()
 
-    def create_folder(
+    async def get_folders_by_names(
             self,
-            name: str,
+            names: List[str],
             user_id: int
     ):
-        self.db_session.close()
-        with self.db_session.begin():
-            stmt = insert_folders_q(
-            ).values(
-                name=name,
-                user_id=user_id
-            )
-            self.db_session.execute(stmt)
+        # Folders are deleted by names, locked rows don't get new files until commit
+        stmt = select_folders_q(
+        ).where(
+            Folders.name.in_(names),
+            Folders.user_id == user_id
+        ).with_for_update()
+        result = await self.db_session.execute(stmt)
+        return result.scalars().all()
+
+    async def create_folder(
+            self,
+            name: str,
+            user_id: int
+    ) -> Optional[int]:
+        # Returns None if folder with this name exists
+        stmt = insert_folders_q(
+        ).values(
+            name=name,
+            user_id=user_id
+        ).on_conflict_do_nothing(
+            index_elements=[Folders.user_id, Folders.name]
+        ).returning(
+            Folders.id
+        )
+        result = await self.db_session.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def create_folders(
+            self,
+            names: List[str],
+            user_id: int
+    ) -> Set[str]:
+        # All folders in one statement, returns names of created folders
+        if not names:
+            return set()
+        stmt = insert_folders_q(
+        ).values(
+            [{"name": name, "user_id": user_id} for name in names]
+        ).on_conflict_do_nothing(
+            index_elements=[Folders.user_id, Folders.name]
+        ).returning(
+            Folders.name
+        )
+        result = await self.db_session.execute(stmt)
+        return set(result.scalars())
 
-    def rename_folder(
+    async def rename_folder(
             self,
             old_name: str,
             new_name: str,
             user_id: int
     ):
-        self.db_session.close()
-        with self.db_session.begin():
-            stmt = update_folders_q(
-            ).where(
-                Folders.name == old_name,
-                Folders.user_id == user_id
-            ).values(
-                name=new_name
-            )
-            self.db_session.execute(stmt)
+        stmt = update_folders_q(
+        ).where(
+            Folders.name == old_name,
+            Folders.user_id == user_id
+        ).values(
+            name=new_name
+        )
+        await self.db_session.execute(stmt)
 
-    def delete_folder(
+    async def delete_folder(
             self,
             name: str,
             user_id: int
     ):
-        self.db_session.close()
-        with self.db_session.begin():
-            stmt = delete_folders_q(
-            ).where(
-                Folders.name == name,
-                Folders.user_id == user_id
-            )
-            self.db_session.execute(stmt)
+        stmt = delete_folders_q(
+        ).where(
+            Folders.name == name,
+            Folders.user_id == user_id
+        )
+        await self.db_session.execute(stmt)
+
+    async def delete_folders(
+            self,
+            folder_ids: List[int],
+            user_id: int
+    ):
+        stmt = delete_folders_q(
+        ).where(
+            Folders.id.in_(folder_ids),
+            Folders.user_id == user_id
+        ).execution_options(
+            synchronize_session=False
+        )
+        await self.db_session.execute(stmt)
 
-    def get_folder_from_file(
+    async def get_folder_from_file(
             self,
             folder_id: int
     ):
@@ -100,5 +153,5 @@ class FoldersService(BaseService):
         ).where(
             Folders.id == folder_id
         )
-        result = self.db_session.execute(stmt)
+        result = await self.db_session.execute(stmt)
         return result.scalar_one_or_none()
@@ -0,0 +1,93 @@
+from datetime import timedelta
+
+from sqlalchemy.sql import func
+
+from . import BaseService
+from app.models.models import UploadSessions
+from app.queries.uploads import (
+    select_upload_sessions_q,
+    insert_upload_sessions_q,
+    delete_upload_sessions_q
+)
+
+
+class UploadSessionsService(BaseService):
+
+    async def create_session(
+            self,
+            session_id: str,
+            name: str,
+            full_name: str,
+            size: int,
+            chunk_size: int,
+            _type: str,
+            expire_minutes: int,
+            folder_id: int,
+            user_id: int
+    ):
+        stmt = insert_upload_sessions_q(
+        ).values(
+            id=session_id,
+            name=name,
+            full_name=full_name,
+            size=size,
+            chunk_size=chunk_size,
+            type=_type,
+            expires_at=func.now() + timedelta(minutes=expire_minutes),
+            folder_id=folder_id,
+            user_id=user_id
+        )
+        await self.db_session.execute(stmt)
+
+    async def get_session(
+            self,
+            session_id: str,
+            user_id: int
+    ):
+        stmt = select_upload_sessions_q(
+        ).where(
+            UploadSessions.id == session_id,
+            UploadSessions.user_id == user_id,
+            UploadSessions.expires_at > func.now()
+        )
+        result = await self.db_session.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def get_session_ids(
+            self,
+            user_id: int
+    ):
+        stmt = select_upload_sessions_q(
+        ).where(
+            UploadSessions.user_id == user_id
+        ).with_only_columns(
+            UploadSessions.id
+        )
+        result = await self.db_session.execute(stmt)
+        return set(result.scalars())
+
+    async def delete_session(
+            self,
+            session_id: str
+    ):
+        stmt = delete_upload_sessions_q(
+        ).where(
+            UploadSessions.id == session_id
+        ).returning(
+            UploadSessions.id
+        )
+        result = await self.db_session.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def delete_expired_sessions(self):
+        stmt = delete_upload_sessions_q(
+        ).where(
+            UploadSessions.expires_at <= func.now()
+        ).returning(
+            UploadSessions.id,
+            UploadSessions.user_id
+        ).execution_options(
+            synchronize_session=False
+        )
+        result = await self.db_session.execute(stmt)
+        return result.all()
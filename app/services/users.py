@@ -1,42 +1,125 @@
-from typing import Optional
+from datetime import datetime
+from typing import List, Optional, Tuple
 
 from . import BaseService
-from app.models.models import Users
+from app.models.models import Users, TokenRevocations, RevokedSessions
 from app.queries.users import (
-    select_user_q,
-    insert_user_q
+    select_user_by_username_q,
+    insert_user_q,
+    update_user_q,
+    select_token_revocations_q,
+    insert_token_revocation_q,
+    select_revoked_sessions_q,
+    insert_revoked_session_q,
+    delete_revoked_sessions_q
 )
 
 
 class UsersService(BaseService):
 
-    def get_by_username(
+    async def get_by_username(
             self,
             username: str
     ) -> Optional[Users]:
-        stmt = select_user_q(
-        ).where(
-            Users.username == username
+        result = await self.db_session.execute(
+            select_user_by_username_q(),
+            {"username": username}
         )
-        result = self.db_session.execute(stmt)
         user = result.scalar_one_or_none()
         return user
 
-    def create_user(
+    async def create_user(
             self,
             username: str,
             password: str,
             full_name: str,
             age: Optional[int] = None
+    ) -> Optional[int]:
+        # Returns None if username is taken
+        stmt = insert_user_q(
+        ).values(
+            username=username,
+            password=password,
+            full_name=full_name,
+            age=age
+        ).on_conflict_do_nothing(
+            index_elements=[Users.username]
+        ).returning(
+            Users.id
+        )
+        result = await self.db_session.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def update_password(
+            self,
+            user_id: int,
+            password: str
+    ):
+        stmt = update_user_q(
+        ).where(
+            Users.id == user_id
+        ).values(
+            password=password
+        ).execution_options(
+            synchronize_session=False
+        )
+        await self.db_session.execute(stmt)
+
+    async def revoke_tokens(
+            self,
+            user_id: int,
+            revoked_at: datetime
+    ):
+        stmt = insert_token_revocation_q()
+        stmt = stmt.values(
+            user_id=user_id,
+            revoked_at=revoked_at
+        ).on_conflict_do_update(
+            index_elements=[TokenRevocations.user_id],
+            set_={"revoked_at": stmt.excluded.revoked_at}
+        )
+        await self.db_session.execute(stmt)
+
+    async def get_revocations(
+            self,
+            since: datetime
+    ) -> List[Tuple[int, datetime]]:
+        stmt = select_token_revocations_q(
+        ).where(
+            TokenRevocations.revoked_at > since
+        )
+        result = await self.db_session.execute(stmt)
+        return result.all()
+
+    async def revoke_session(
+            self,
+            session_id: str,
+            expires_at: datetime
     ):
-        # Close started session and start new
-        self.db_session.close()
-        with self.db_session.begin():
-            stmt = insert_user_q(
-            ).values(
-                username=username,
-                password=password,
-                full_name=full_name,
-                age=age
-            )
-            self.db_session.execute(stmt)
+        # Remove revocations of expired sessions
+        stmt = delete_revoked_sessions_q(
+        ).where(
+            RevokedSessions.expires_at <= datetime.utcnow()
+        ).execution_options(
+            synchronize_session=False
+        )
+        await self.db_session.execute(stmt)
+        stmt = insert_revoked_session_q(
+        ).values(
+            session_id=session_id,
+            expires_at=expires_at
+        ).on_conflict_do_nothing(
+            index_elements=[RevokedSessions.session_id]
+        )
+        await self.db_session.execute(stmt)
+
+    async def get_revoked_sessions(
+            self,
+            now: datetime
+    ) -> List[Tuple[str, datetime]]:
+        stmt = select_revoked_sessions_q(
+        ).where(
+            RevokedSessions.expires_at > now
+        )
+        result = await self.db_session.execute(stmt)
+        return result.all()